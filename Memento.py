@@ -1,26 +1,245 @@
+import io
 import pickle
 import os
-from copy import deepcopy
+import serializer
+import json
+import struct
+import zlib
+import hashlib
+import threading
+from bisect import insort
+from time import time
 from Singleton import SingletonMeta
+from saver import SaveWorker
+from utils import write_atomically
+from constants import SAVES_DIRECTORY, SAVES_PER_PAGE, SAVE_BLOBS, SAVE_COMPRESSION, SAVE_UNREADABLE
+
+
+# a save file is the magic, the length of a JSON header describing the save, the header, then the compressed
+# serialized world; in the world each saved room is the name of a blob holding its serialized data, so identical
+# rooms are stored once. Saves written as pickles by earlier versions are converted to this format when the
+# saves are first read, so loading a save never unpickles anything
+SAVE_MAGIC = b'OOPS'
+HEADER_LENGTH = struct.Struct('<I')
+
+
+class SaveUnpickler(pickle.Unpickler):
+    # the pickles of earlier versions only ever held plain data and positions; nothing else may be constructed
+    ALLOWED = {('objects', 'Position')} | {('builtins', name) for name in ('set', 'frozenset', 'complex', 'bytearray')}
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f'{module}.{name} is not allowed in a save')
+        return super().find_class(module, name)
 
 
 class Memento:
-    def __init__(self, name, data):
+    def __init__(self, name, data, header=None):
         self.savename = name
         self.data = data
+        self.header = {} if header is None else header
 
 
 class Caretaker(metaclass=SingletonMeta):
-    def __init__(self):
-        files = list(os.walk('OOP_game/saves'))[0][2]
-        
-        self.saves = {}
-        for filename in files:
-            with open('OOP_game/saves/'+filename, 'rb') as save:
-                self.saves.update({filename: pickle.load(save)})
+    # only the headers are read at startup; a save's world is decoded when that save is loaded.
+    # Saves can be written by a background worker, whose completions update the index under the lock
+    def __init__(self, directory=SAVES_DIRECTORY):
+        self.__directory = directory
+        self.__headers = {}
+        self.__order = []
+        self.__lock = threading.Lock()
+        # held while blobs are stored or swept, so a sweep never removes the blobs of a save still being written
+        self.__blobs = threading.Lock()
+        self.__worker = SaveWorker(self.write)
+        converted = False
+        for filename in list(os.walk(directory))[0][2]:
+            if not filename.endswith('.tmp'):
+                header = self.__read_header(filename)
+                if 'format' not in header:
+                    header = self.__convert(filename, header)
+                    converted = True
+                if header is not None:
+                    self.__index(header)
+        if converted:
+            # the pickled blobs of converted saves are only left once every save has been converted
+            with self.__blobs:
+                self.__sweep()
+
+    def __path(self, name):
+        return os.path.join(self.__directory, name)
+
+    @staticmethod
+    def __header_of(save):
+        if save.read(len(SAVE_MAGIC)) == SAVE_MAGIC:
+            length, = HEADER_LENGTH.unpack(save.read(HEADER_LENGTH.size))
+            return json.loads(save.read(length))
+        save.seek(0)
+        return None
+
+    def __read_header(self, filename):
+        with open(self.__path(filename), 'rb') as save:
+            header = self.__header_of(save)
+        if header is not None:
+            return header
+        # saves from before headers are a bare pickle; what the file system knows has to do
+        stat = os.stat(self.__path(filename))
+        return {'name': filename, 'timestamp': stat.st_mtime, 'level': None, 'hero': None, 'size': stat.st_size}
+
+    def __convert(self, filename, header):
+        # a save from an earlier version is unpickled once and written again in the current format, keeping its
+        # timestamp; one that cannot be read that way is moved aside rather than offered for loading
+        try:
+            return self.write(Memento(filename, self.__unpickle(filename), header))
+        except Exception:
+            os.makedirs(os.path.join(self.__directory, SAVE_UNREADABLE), exist_ok=True)
+            os.replace(self.__path(filename), os.path.join(self.__directory, SAVE_UNREADABLE, filename))
+            return None
+
+    @staticmethod
+    def __legacy(payload):
+        if serializer.is_serialized(payload):
+            return serializer.loads(payload)
+        return SaveUnpickler(io.BytesIO(payload)).load()
+
+    def __unpickle(self, filename):
+        _, payload = self.__payload(filename)
+        data = self.__legacy(payload)
+        # older saves hold the rooms themselves, or None for missing ones
+        for rooms in data['map'].values():
+            for index in rooms:
+                if isinstance(rooms[index], str):
+                    with open(os.path.join(self.__directory, SAVE_BLOBS, rooms[index]), 'rb') as blob:
+                        rooms[index] = self.__legacy(blob.read())
+        return data
+
+    @staticmethod
+    def __key(header):
+        return -header['timestamp'], header['name']
+
+    def __index(self, header):
+        if header['name'] in self.__headers:
+            self.__order.remove(self.__key(self.__headers[header['name']]))
+        self.__headers[header['name']] = header
+        insort(self.__order, self.__key(header))
+
+    def __store(self, data):
+        blob = serializer.dumps(data)
+        name = hashlib.sha256(blob).hexdigest()
+        path = os.path.join(self.__directory, SAVE_BLOBS, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomically(path, blob)
+        return name
+
+    @staticmethod
+    def __decode(payload):
+        if not serializer.is_serialized(payload):
+            raise ValueError('Save data is not in the serialized format')
+        return serializer.loads(payload)
+
+    def __fetch(self, name):
+        with open(os.path.join(self.__directory, SAVE_BLOBS, name), 'rb') as file:
+            return self.__decode(file.read())
+
+    def __payload(self, name):
+        with open(self.__path(name), 'rb') as save:
+            header = self.__header_of(save)
+            payload = save.read()
+        if header is not None and header.get('compression') == 'zlib':
+            payload = zlib.decompress(payload)
+        return header, payload
+
+    def __read(self, name):
+        _, payload = self.__payload(name)
+        return self.__decode(payload)
+
+    def __references(self, name):
+        with open(self.__path(name), 'rb') as save:
+            header = self.__header_of(save)
+        if header is None:
+            # saves from before headers hold their rooms themselves
+            return ()
+        if 'blobs' in header:
+            return header['blobs']
+        data = self.__read(name)
+        return [blob for rooms in data['map'].values() for blob in rooms.values() if isinstance(blob, str)]
+
+    def __sweep(self):
+        # blobs no save refers to any more, left by removed or overwritten saves
+        directory = os.path.join(self.__directory, SAVE_BLOBS)
+        if not os.path.isdir(directory):
+            return
+        referenced = set()
+        for filename in list(os.walk(self.__directory))[0][2]:
+            if not filename.endswith('.tmp'):
+                try:
+                    referenced.update(self.__references(filename))
+                except Exception:
+                    # a save that cannot be read might still need any blob; nothing is removed this time
+                    return
+        for blob in os.listdir(directory):
+            if blob not in referenced and not blob.endswith('.tmp'):
+                os.remove(os.path.join(directory, blob))
+
+    def write(self, save: Memento):
+        with self.__blobs:
+            data = dict(save.data)
+            data['map'] = { level: {index: self.__store(room) for index, room in rooms.items()}
+                            for level, rooms in save.data['map'].items() }
+            blobs = sorted({blob for rooms in data['map'].values() for blob in rooms.values()})
+            payload = zlib.compress(serializer.dumps(data), SAVE_COMPRESSION)
+            header = dict(save.header, name=save.savename, timestamp=save.header.get('timestamp', time()), size=len(payload), compression='zlib',
+                          format=serializer.VERSION, blobs=blobs)
+            encoded = json.dumps(header).encode()
+            write_atomically(self.__path(save.savename), SAVE_MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded + payload)
+            self.__sweep()
+        return header
 
     def add_save(self, save: Memento):
-        self.saves.update({save.savename: save.data})
+        self.__completed(self.write(save))
+
+    def save_async(self, save: Memento):
+        self.__worker.submit(save, self.__completed)
+
+    def __completed(self, header):
+        with self.__lock:
+            self.__index(header)
+
+    def wait(self):
+        self.__worker.wait()
+
+    @property
+    def saving(self):
+        return self.__worker.busy
+
+    def remove_save(self, name):
+        with self.__blobs:
+            os.remove(self.__path(name))
+            self.__sweep()
+        with self.__lock:
+            self.__order.remove(self.__key(self.__headers.pop(name)))
+
+    def get_save(self, name):
+        data = self.__read(name)
+        for rooms in data['map'].values():
+            for index in rooms:
+                rooms[index] = self.__fetch(rooms[index])
+        return data
+
+    def get_header(self, name):
+        with self.__lock:
+            return self.__headers[name]
+
+    def header(self, position):
+        with self.__lock:
+            return self.__headers[self.__order[position][1]]
+
+    def page(self, number, size=SAVES_PER_PAGE):
+        with self.__lock:
+            return [self.__headers[key[1]] for key in self.__order[number*size:(number+1)*size]]
+
+    def __len__(self):
+        return len(self.__order)
 
-    def get_save(self, filename):
-        return deepcopy(self.saves[filename])
+    def __contains__(self, name):
+        return name in self.__headers
@@ -0,0 +1,199 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import pygame
+import utils
+from collections import namedtuple
+from constants import *
+
+
+VERSION = 1
+
+SHEETS = {
+    'tmp':       'OOP_game/assets/hero.png',
+    'hero1':     'OOP_game/assets/move.png',
+    'hero2':     'OOP_game/assets/attack.png',
+    'inventory': 'OOP_game/assets/inventory1.png',
+    'slot':      'OOP_game/assets/activeslot.png',
+    'health':    'OOP_game/assets/health.png',
+    'armor':     'OOP_game/assets/armor.png',
+    'coin':      'OOP_game/assets/coin.png',
+    'pause':     'OOP_game/assets/pause.png',
+    'shop':      'OOP_game/assets/shop.png',
+    'savename':  'OOP_game/assets/savename.png',
+    'portals':   'OOP_game/assets/portals.png',
+    'pirate1':   'OOP_game/assets/pirate move.png',
+    'pirate2':   'OOP_game/assets/pirate attack.png'
+}
+
+# a frame is cut from a spritesheet, then rotated and flipped before it is packed
+Frame = namedtuple('Frame', ('sheet', 'area', 'angle', 'flip'), defaults=(0, False))
+
+# each group is packed into an atlas of its own and loaded as a whole; groups nest dicts and lists of frames,
+# and the frames read back from an atlas come in the same shape
+GROUPS = {
+    'world': {
+        'tiles': {
+            '#': Frame('tmp', ( 0*16,  1*16, 16, 16)),
+            '_': Frame('tmp', ( 1*16,  0*16, 16, 16)),
+            ']': Frame('tmp', ( 1*16,  0*16, 16, 16), 90),
+            '[': Frame('tmp', ( 1*16,  0*16, 16, 16), -90),
+            '.': Frame('tmp', ( 0*16,  5*16, 16, 16)),
+            '*': Frame('tmp', ( 0*16, 15*16, 16, 16))
+        },
+        'items': {
+            'Sword': Frame('tmp', (13*16,  3*16, 16, 16))
+        },
+        'bargainer': Frame('tmp', (9*16, 15*16, 16, 16))
+    },
+    'interface': {
+        'inventory_bar': Frame('inventory', (0, 0, INVENTORY_BAR_SIZE[1], INVENTORY_BAR_SIZE[0]), 90),
+        'equipment_bar': Frame('inventory', (0, 0, 45, 180)),
+        'active_slot':   Frame('slot', (0, 0, 45, 45)),
+        'fullHeart':     Frame('health', (0, 0, 23, 21)),
+        'halfHeart':     Frame('health', (23, 0, 23, 21)),
+        'emptyHeart':    Frame('health', (46, 0, 23, 21)),
+        'armor':         Frame('armor', (0, 0, 23, 21)),
+        'coin':          Frame('coin', (0, 0, 16, 16))
+    },
+    'hero': {
+        'move': [Frame('hero1', (64*(i%FC_HERO_MOVE), 64*(i//FC_HERO_MOVE), 64, 64)) for i in range(FC_HERO_MOVE*2)]
+    },
+    'hero_attack': {
+        'attack': [Frame('hero2', (158*(i%FC_HERO_ATTACK), 0, 158, 112)) for i in range(FC_HERO_ATTACK)]
+    },
+    'pirates': {
+        'move':   [Frame('pirate1', (50*i, 0, 50, 32)) for i in range(2)],
+        'attack': [Frame('pirate2', (50*i, 0, 50, 32)) for i in range(7)]
+    },
+    'portals': {
+        'blue': [Frame('portals', (40*i, 0, 40, 75)) for i in range(9)],
+        'red':  [Frame('portals', (40*i, 75, 40, 75), flip=True) for i in range(9)]
+    },
+    'menus': {
+        'pause_menu':     Frame('pause', (0, 0, PAUSE_MENU_SIZE[0], PAUSE_MENU_SIZE[1])),
+        'shop_menu':      Frame('shop', (0, 0, SHOP_MENU_SIZE[0], SHOP_MENU_SIZE[1])),
+        'savename_input': Frame('savename', (0, 0, SAVENAME_INPUT[0], SAVENAME_INPUT[1]))
+    }
+}
+
+
+def frames(node):
+    if isinstance(node, Frame):
+        yield node
+    elif isinstance(node, dict):
+        for child in node.values():
+            yield from frames(child)
+    else:
+        for child in node:
+            yield from frames(child)
+
+
+def rects(node, places):
+    # the shape of the group with every frame replaced by where it was packed
+    if isinstance(node, Frame):
+        return places[node]
+    elif isinstance(node, dict):
+        return {name: rects(child, places) for name, child in node.items()}
+    return [rects(child, places) for child in node]
+
+
+def pack(sizes, width):
+    # shelf packing: the tallest frames first, each row as high as its first frame.
+    # The atlas is cut down to the widest row, so a group of a few small frames stays small
+    places = [None]*len(sizes)
+    x = y = shelf = used = 0
+    for index in sorted(range(len(sizes)), key=lambda index: -sizes[index][1]):
+        w, h = sizes[index]
+        if x + w > width:
+            x, y, shelf = 0, y+shelf, 0
+        places[index] = (x, y)
+        x += w
+        shelf = max(shelf, h)
+        used = max(used, x)
+    return places, used, y+shelf
+
+
+class AtlasBuilder:
+    # atlases are cached under a directory named after the hash of the spritesheets, the groups and the format version
+    def __init__(self, build=ASSET_BUILD):
+        self.__build = build
+
+    def build(self):
+        digest = hashlib.sha256(str(VERSION).encode())
+        digest.update(repr(GROUPS).encode())
+        for name in sorted(SHEETS):
+            with open(SHEETS[name], 'rb') as sheet:
+                digest.update(sheet.read())
+        directory = os.path.join(self.__build, digest.hexdigest())
+
+        if not os.path.isdir(directory):
+            utils.write_atomically(directory, self.__compile)
+        return directory
+
+    @staticmethod
+    def __cut(sheets, frame):
+        if frame.sheet not in sheets:
+            try:
+                sheets[frame.sheet] = pygame.image.load(SHEETS[frame.sheet])
+            except:
+                raise SystemExit(f'Unable to open file {SHEETS[frame.sheet]}')
+        rect = pygame.Rect(frame.area)
+        image = pygame.Surface(rect.size, pygame.SRCALPHA)
+        image.blit(sheets[frame.sheet], (0, 0), rect)
+        if frame.angle:
+            image = pygame.transform.rotate(image, frame.angle)
+        if frame.flip:
+            image = pygame.transform.flip(image, True, False)
+        return image
+
+    def __compile(self, temporary):
+        os.makedirs(temporary)
+        sheets = {}
+        for group, node in GROUPS.items():
+            # a frame listed twice in a group is packed once
+            unique = list(dict.fromkeys(frames(node)))
+            images = [self.__cut(sheets, frame) for frame in unique]
+            sizes = [image.get_size() for image in images]
+            positions, width, height = pack(sizes, max([ATLAS_WIDTH] + [w for w, _ in sizes]))
+
+            pixels = np.zeros((height, width, 4), dtype=np.uint8)
+            places = {}
+            for frame, image, (x, y), (w, h) in zip(unique, images, positions, sizes):
+                pixels[y:y+h, x:x+w] = np.frombuffer(pygame.image.tobytes(image, 'RGBA'), dtype=np.uint8).reshape(h, w, 4)
+                places[frame] = (x, y, w, h)
+
+            with open(os.path.join(temporary, f'{group}.rgba'), 'wb') as output:
+                output.write(pixels.tobytes())
+            with open(os.path.join(temporary, f'{group}.json'), 'w') as output:
+                json.dump({'size': (width, height), 'frames': rects(node, places)}, output, separators=(',', ':'))
+
+
+class Atlas:
+    # the frames are subsurfaces of one surface, so a group costs one allocation and one read of raw pixels
+    def __init__(self, directory, group):
+        with open(os.path.join(directory, f'{group}.json')) as index:
+            index = json.load(index)
+        with open(os.path.join(directory, f'{group}.rgba'), 'rb') as pixels:
+            self.__surface = pygame.image.frombytes(pixels.read(), index['size'], 'RGBA').convert_alpha()
+        self.frames = self.__views(index['frames'])
+
+    def __views(self, node):
+        if isinstance(node, dict):
+            return {name: self.__views(child) for name, child in node.items()}
+        elif isinstance(node[0], int):
+            return self.__surface.subsurface(node)
+        return [self.__views(child) for child in node]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the spritesheets into the atlas cache')
+    parser.add_argument('--build', default=ASSET_BUILD)
+    args = parser.parse_args()
+
+    directory = AtlasBuilder(args.build).build()
+    for group in GROUPS:
+        with open(os.path.join(directory, f'{group}.json')) as index:
+            print(group, json.load(index)['size'], os.path.join(directory, f'{group}.rgba'))
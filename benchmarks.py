@@ -0,0 +1,128 @@
+import sys
+import json
+import random
+import argparse
+import statistics
+from time import perf_counter
+from headless import HeadlessGame
+from pygame.locals import *
+from objects import Room, Hero, Pirate, Portal, Armor, Item, Position
+from interface import UserInterface
+from Memento import Caretaker
+from constants import *
+
+
+BENCHMARK_SAVE = '__benchmark__'
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        timings.append((perf_counter()-start)*1000)
+    timings.sort()
+    return { 'runs':      repeat,
+             'mean_ms':   statistics.fmean(timings),
+             'median_ms': statistics.median(timings),
+             'p95_ms':    timings[min(repeat-1, int(repeat*0.95))],
+             'max_ms':    timings[-1] }
+
+
+def free_cells(room, rng, count):
+    cells = [ (x, y) for y in range(int(VERTICAL_TILES_COUNT)-1) for x in range(int(HORIZONTAL_TILES_COUNT))
+              if not room.collides(x, y, 1, 2) ]
+    return [rng.choice(cells) for _ in range(count)]
+
+
+def pirate_room(count, seed=0):
+    room = Room.create('OOP_game/levels/teen.txt')
+    for x, y in free_cells(room, random.Random(seed), count):
+        room.add('entities', Pirate(pos=Position(x, y)))
+    return room
+
+
+def portal_room(count, seed=0):
+    room = Room.create('OOP_game/levels/test.txt')
+    for x, y in free_cells(room, random.Random(seed), count):
+        room.add('portals', Portal(pos=Position(x, y), destination={'position': Position(x, y), 'level': 'level1'}))
+    return room
+
+
+def equipped_hero():
+    hero = Hero(pos=Position(10, 6))
+    for slot in hero._inventory['items']:
+        hero.take_item(Item('Sword'), slot)
+    for slot in hero._inventory['equipment']:
+        hero._inventory['equipment'][slot] = Armor('Sword', armor=1, slot=slot)
+    hero._armor = 4
+    return hero
+
+
+def run(pirates=(0, 10, 100), portals=20, repeat=200):
+    game = HeadlessGame(render=True)
+    screen = game.screen
+    results = {}
+
+    for count in pirates:
+        room = pirate_room(count)
+        hero = Hero(pos=Position(10, 6))
+        results[f'room.update[pirates={count}]'] = measure(lambda: room.update(hero), repeat)
+        results[f'room.render[pirates={count}]'] = measure(lambda: room.render(screen), repeat)
+
+    room = portal_room(portals)
+    hero = Hero(pos=Position(10, 6))
+    results[f'room.update[portals={portals}]'] = measure(lambda: room.update(hero), repeat)
+    results[f'room.render[portals={portals}]'] = measure(lambda: room.render(screen), repeat)
+
+    room = Room.create('OOP_game/levels/teen.txt')
+    hero = Hero(pos=Position(10, 6))
+    keys = iter([K_LEFT, K_RIGHT, K_UP, K_DOWN]*repeat)
+    results['hero.move'] = measure(lambda: hero.move(next(keys), room), repeat)
+
+    interface = UserInterface()
+    hero = equipped_hero()
+    results['interface.render[full inventory]'] = measure(lambda: interface.render(screen, hero), repeat)
+    results['interface.render[full inventory, changed]'] = measure(lambda: (hero._changed(), interface.render(screen, hero)), repeat)
+
+    state = game.state
+    results['gamestate.save'] = measure(lambda: state.save(BENCHMARK_SAVE, background=False), max(1, repeat//10))
+    results['gamestate.load'] = measure(lambda: state.load(Caretaker().get_save(BENCHMARK_SAVE)), max(1, repeat//10))
+    results['caretaker.startup'] = measure(lambda: Caretaker.__new__(Caretaker).__init__(), max(1, repeat//10))
+    Caretaker().remove_save(BENCHMARK_SAVE)
+
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    failed = []
+    for name, result in results.items():
+        if name in baseline and result['median_ms'] > baseline[name]['median_ms']*(1+tolerance):
+            failed.append(name)
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the update and render hot paths without a display.')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--pirates', default='0,10,100', help='comma separated monster counts')
+    parser.add_argument('--portals', type=int, default=20)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown of the median against the baseline')
+    args = parser.parse_args()
+
+    results = run(tuple(int(count) for count in args.pirates.split(',')), args.portals, args.repeat)
+    for name, result in results.items():
+        print(f"{name:45} median {result['median_ms']:8.3f} ms   p95 {result['p95_ms']:8.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            failed = regressions(results, json.load(baseline), args.tolerance)
+        for name in failed:
+            print(f'REGRESSION: {name}')
+        sys.exit(1 if failed else 0)
@@ -21,6 +21,25 @@ COIN_SIZE = (16, 16)
 PAUSE_MENU_SIZE = (200, 125)
 SHOP_MENU_SIZE = (235, 215)
 SAVENAME_INPUT = (800, 50)
+SAVES_DIRECTORY = 'OOP_game/saves'
+SAVES_PER_PAGE = 15
+SAVE_BLOBS = '.blobs' # room data shared between saves, named after its hash
+SAVE_COMPRESSION = 6 # zlib level
+SAVE_UNREADABLE = '.unreadable' # saves from earlier versions that could not be converted
+AUTOSAVE_INTERVAL = 5 # minutes of play between autosaves, 0 turns them off
+AUTOSAVE_SLOTS = 3
+
+TRANSFORM_CACHE_SIZE = 512
+TEXT_CACHE_SIZE = 256
+MENU_IDLE_TIMEOUT = 250 # ms an idle menu sleeps waiting for input
+RENDER_FPS = 120 # frame cap, the simulation itself always ticks at GameState.fps; 0 is uncapped
+MAX_FRAME_TIME = 0.25 # s of simulation caught up after a stall, the rest is dropped
+DIRTY_RECTS = False # redraw only the changed parts of the gameplay screen
+
+PROFILER_WINDOW = 300 # frames the rolling averages and percentiles are taken over
+PROFILER_MAX_ROWS = 100000 # frames kept for the CSV export
+PROFILER_REFRESH = 15 # frames between overlay redraws
+PROFILER_SIZE = (260, 174)
 
 FC_HERO_MOVE = 8
 FC_HERO_ATTACK = 17
@@ -28,11 +47,33 @@ FC_HERO_ATTACK = 17
 HORIZONTAL_TILES_COUNT = PLAYABLE_WIDTH / TILE_SIZE[0]
 VERTICAL_TILES_COUNT = PLAYABLE_HEIGHT / TILE_SIZE[1]
 
+EMPTY_TILE = 0 # terrain code of cells a level file leaves out
+SOLID_TILES = ('#',)
+LEVEL_MANIFEST = 'OOP_game/levels/manifest.json'
+LEVEL_BUILD = 'OOP_game/build/levels' # compiled levels, one directory per manifest and maps hash
+COMPILED_LEVEL_EXTENSION = '.lvl'
+ASSET_BUILD = 'OOP_game/build/assets' # packed atlases, one directory per spritesheets hash
+ATLAS_WIDTH = 1024 # pixels; frames are packed in rows up to this width
+SOUND_BUILD = 'OOP_game/build/sounds' # decoded sound effects, one file per source and mixer format hash
+SOUND_VOICES = 8 # mixer channels shared by all sound effects
+BACKGROUND_INTERVAL = 4 # ticks between updates of rooms the hero is not in
+BACKGROUND_BUDGET = 0.002 # seconds per tick spent on those rooms
+MAX_CATCH_UP = 60 # updates a room can owe; the rest of its time away is skipped
+MAX_LOADED_ROOMS = 9 # rooms kept in memory; the least recently visited ones beyond that are unloaded
+SPATIAL_CELL_SIZE = 4 # tiles
+AGGRO_RADIUS = 9 # tiles
+SWARM_THRESHOLD = 32 # pirates in a room before they are stepped as one batch
+
 RIGHT = 0
 LEFT = 1
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
+GREY = (35, 35, 35)
+
+MENU_FONT = ('Bahnschrift', 24)
+HUD_FONT = ('Bahnschrift', 14)
+PROFILER_FONT = ('Consolas', 12)
 
 KEYBINDS = {
         'movement': {
@@ -62,5 +103,10 @@ KEYBINDS = {
                        'chest': K_8,
                        'legs':  K_9,
                        'arm':   K_0
-                     }
+                     },
+
+        'profiler': {
+                      'toggle': K_F3,
+                      'export': K_F4
+                    }
     }
@@ -1,7 +1,10 @@
 import pygame
 from pygame.locals import *
-from constants import WIDTH, HEIGHT, KEYBINDS
+from time import perf_counter
+from constants import WIDTH, HEIGHT, KEYBINDS, MENU_IDLE_TIMEOUT, RENDER_FPS, MAX_FRAME_TIME
 from gamestates import GameState, Menu, PauseMenu, ShopMenu
+from profiler import Profiler
+from Memento import Caretaker
 
 
 class Game:
@@ -16,53 +19,110 @@ class Game:
         self.__menu = Menu()
         self.__pause_menu = PauseMenu()
         self.__shop_menu = ShopMenu()
+        self.__last_time = None
+        self.__accumulator = 0
 
     def run(self):
         running = True
         key = 0
         symbol = ''
 
+        profiler = Profiler()
+
         while running:
             symbol = ''
-            self.__clock.tick(self.__state.fps)
+            menu = self.__active_menu()
+            if menu is None:
+                self.__clock.tick(RENDER_FPS)
+                profiler.begin_frame()
+                with profiler.section('events'):
+                    events = pygame.event.get()
+            else:
+                # idle menus sleep until input arrives instead of redrawing every frame
+                events = [pygame.event.wait(MENU_IDLE_TIMEOUT)] + pygame.event.get()
 
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == KEYDOWN and event.key == KEYBINDS['profiler']['toggle']:
+                    profiler.toggle()
+                    self.__state.invalidate_screen()
+                elif event.type == KEYDOWN and event.key == KEYBINDS['profiler']['export']:
+                    profiler.export()
                 elif event.type == KEYDOWN:
                     key = event.key
                     symbol = event.unicode
+                elif event.type in (VIDEOEXPOSE, WINDOWEXPOSED) and menu is not None:
+                    menu.redraw()
             
+            if menu is not None:
+                # time spent in a menu is not game time: play resumes with a single tick, not a catch-up burst
+                self.__last_time = None
+                if key:
+                    menu.redraw()
+
             if self.__menu.is_active:
                 self.__menu.process_input(key, self.__state)
                 self.__menu.update()
-                self.__menu.render(self.__screen)
+                if self.__menu.needs_redraw:
+                    self.__menu.render(self.__screen)
                 key = 0
+                self.__state.invalidate_screen()
             elif self.__pause_menu.is_active:
                 self.__pause_menu.process_input(key, symbol, self.__state, self.__menu)
                 self.__pause_menu.update()
-                self.__pause_menu.render(self.__screen)
+                if self.__pause_menu.needs_redraw:
+                    self.__pause_menu.render(self.__screen)
                 key = 0
+                self.__state.invalidate_screen()
             elif self.__shop_menu.is_active:
                 self.__shop_menu.process_input(key, self.__state)
                 self.__shop_menu.update()
-                self.__shop_menu.render(self.__screen, self.__state.bargainer._items)
+                if self.__shop_menu.needs_redraw:
+                    self.__shop_menu.render(self.__screen, self.__state.bargainer._items)
                 key = 0
+                self.__state.invalidate_screen()
             else:
-                if not pygame.key.get_pressed()[key]:
-                    key = 0
-                self.__state.process_input(key, self.__state.interface.active_slot, self.__pause_menu, self.__shop_menu)
-                self.__state.update()
-                self.__state.render(self.__screen)
-                if key == KEYBINDS['attack']:
-                    key = 0
-                if self.__pause_menu.is_active:
-                    key = 0
-                if key == K_o:
-                    key = 0
+                # the world advances in fixed ticks of 1/fps s however fast frames are drawn;
+                # frames are drawn interpolated between the last two ticks
+                tick = 1 / self.__state.fps
+                now = perf_counter()
+                if self.__last_time is None:
+                    self.__accumulator = tick
+                else:
+                    self.__accumulator += min(now - self.__last_time, MAX_FRAME_TIME)
+                self.__last_time = now
 
+                while self.__accumulator >= tick:
+                    self.__accumulator -= tick
+                    if not pygame.key.get_pressed()[key]:
+                        key = 0
+                    with profiler.section('input'):
+                        self.__state.process_input(key, self.__state.interface.active_slot, self.__pause_menu, self.__shop_menu)
+                    self.__state.update()
+                    if key == KEYBINDS['attack']:
+                        key = 0
+                    if self.__pause_menu.is_active:
+                        key = 0
+                    if key == K_o:
+                        key = 0
+                    if self.__pause_menu.is_active or self.__shop_menu.is_active:
+                        self.__accumulator = 0
+                        break
+
+                if self.__active_menu() is None:
+                    self.__state.render(self.__screen, self.__accumulator / tick)
+                profiler.end_frame()
+
+        Caretaker().wait()
         pygame.quit()
     
+    def __active_menu(self):
+        for menu in (self.__menu, self.__pause_menu, self.__shop_menu):
+            if menu.is_active:
+                return menu
+        return None
+
     @property
     def state(self):
         return self.__state
@@ -1,5 +1,4 @@
 import pygame
-import pickle
 from pygame.locals import *
 from objects import *
 from constants import *
@@ -7,50 +6,34 @@ from interface import UserInterface
 from Memento import *
 from sounds import Sounds
 from utils import *
+from profiler import Profiler
+from world import World
+from levelcompiler import LevelCompiler
+from scheduler import BackgroundScheduler
 
 
 class GameState:
-    def __init__(self, fps=60):
+    def __init__(self, fps=60, dirty_rects=DIRTY_RECTS, autosave=True):
         Caretaker()
         pygame.mixer.music.load('OOP_game/sounds/background2.mp3')
         pygame.mixer.music.set_volume(0.2)
         self.__fps = fps
-        self.__camera_pos = (1, 1)
-        self.__levels = { 'level1': {
-                                      (0, 0): Room.create('OOP_game/levels/test.txt'),
-                                      (0, 1): Room.create('OOP_game/levels/temp.txt'),
-                                      (1, 0): Room.create('OOP_game/levels/tree.txt'),
-                                      (1, 1): Room.create('OOP_game/levels/teen.txt')
-                                    },
-
-                          'level2': {
-                                      (0, 0): Room.create('OOP_game/levels/omga.txt'),
-                                      (0, 1): None,
-                                      (1, 0): Room.create('OOP_game/levels/true.txt'),
-                                      (1, 1): None
-                                    },
-
-                          'level3': {
-                                      (0, 0): Room.create('OOP_game/levels/teen.txt'),
-                                      (0, 1): None,
-                                      (1, 0): None,
-                                      (1, 1): None
-                                    }
-                           # ... and so on
-                        }
-        self.__level = 'level1'
-        self.__room = self.__levels[self.__level][self.__camera_pos]
-        self.__bargainer = Bargainer(name='Cleven', pos=Position(30, 20))
-        self.__bargainer._items[4] = Armor('Sword', 239, pos=Position(16, 8), armor=3, slot='arm')
-        self.__room._objects['entities'].append(self.__bargainer)
-        self.__levels['level1'][(1, 0)]._objects['entities'].append(Pirate(pos=Position(37, 7)))
-        self.__room._objects['items'].append(Armor('Sword', pos=Position(16+HORIZONTAL_TILES_COUNT, 8+VERTICAL_TILES_COUNT), armor=3, slot='arm'))
-        self.__levels['level1'][(0, 0)]._objects['portals'].append(Portal(pos=Position(20, 3), color='blue', destination={'position': Position(25, 3), 'level': 'level1'}))
-        self.__levels['level1'][(0, 0)]._objects['portals'].append(Portal(pos=Position(15, 3), color='red', destination={'position': Position(5, 7), 'level': 'level2'}))
-        self.__hero = Hero(pos=Position(39, 17))
+        self.__dirty_rects = dirty_rects
+        self.__dirty = []
+        self.__rendered_room = None
+        self.__world, start = self.__create_world()
+        self.__level = start['level']
+        self.__hero = Hero(pos=Position(*start['position']))
+        self.__camera_pos = self.__hero.position.x // HORIZONTAL_TILES_COUNT, self.__hero.position.y // VERTICAL_TILES_COUNT
+        self.__room = self.__world.room(self.__level, self.__camera_pos)
+        self.__bargainer = None
+        self.__scheduler = BackgroundScheduler()
+        self.__ticks = 0
+        self.__autosave = autosave
         self.__interface = UserInterface()
 
     def process_input(self, key, active_slot, pause_menu, shop_menu):
+        self.__hero.remember_position()
         self.__hero._image = Assets().hero_animations['move'][FC_HERO_MOVE*int(bool(self.__hero._inventory['equipment']['arm']))]
         if key in KEYBINDS['inventory'].values():
             self.interface.active_slot = list(KEYBINDS['inventory'].keys())[list(KEYBINDS['inventory'].values()).index(key)]
@@ -58,100 +41,156 @@ class GameState:
             self.__hero.move(key, self.__room)
             self.interface.active_slot = None
         elif key == KEYBINDS['attack']:
-            self.__hero.attack(self.__room._objects['entities'])
+            self.__hero.attack(self.__room)
         elif key == KEYBINDS['interact']:
-            if (self.__hero.position.x-self.__bargainer.position.x)**2 + (self.__hero.position.y-self.__bargainer.position.y)**2 <= 2**2:
-                shop_menu.is_active = True
+            for entity in self.__room.nearby('entities', self.__hero.position.x-2, self.__hero.position.y-2, 4, 4):
+                if isinstance(entity, Bargainer) and (self.__hero.position.x-entity.position.x)**2 + (self.__hero.position.y-entity.position.y)**2 <= 2**2:
+                    self.__bargainer = entity
+                    shop_menu.is_active = True
+                    break
         elif key == KEYBINDS['items']['use'] and isinstance(active_slot, int):
             if isinstance(self.__hero._inventory['items'][active_slot], UsableItem):
                 self.__hero._inventory['items'][active_slot].use(active_slot)
             elif isinstance(self.__hero._inventory['items'][active_slot], EquipableItem):
                 self.__hero._inventory['items'][active_slot].equip(self.__hero, active_slot)
         elif key == KEYBINDS['items']['take']:
-            for item in self.__room._objects['items']:
+            for item in self.__room.nearby('items', self.__hero.position.x, self.__hero.position.y-7/TILE_SIZE[1], 43/TILE_SIZE[0], 57/TILE_SIZE[1]):
                 if self.__hero.empty_slot() and (item.position.x-43/TILE_SIZE[0] <= self.__hero.position.x <= item.position.x and item.position.y-50/TILE_SIZE[1] <= self.__hero.position.y <= item.position.y+7/TILE_SIZE[1]):
-                    self.__room._objects['items'].remove(item)
+                    self.__room.remove('items', item)
                     self.__hero.take_item(item, self.__hero.empty_slot())
                     break
         elif key == KEYBINDS['items']['remove']:
             if isinstance(active_slot, int) and self.__hero._inventory['items'][active_slot] is not None:
-                self.__room._objects['items'].append(self.__hero._inventory['items'][active_slot])
+                item = self.__hero._inventory['items'][active_slot]
                 self.__hero.remove_item(active_slot)
+                self.__room.add('items', item)
             elif isinstance(active_slot, str) and self.__hero._inventory['equipment'][active_slot] is not None:
                 self.__hero._inventory['equipment'][active_slot].remove(self.__hero, active_slot)
         elif key == K_ESCAPE:
             pause_menu.is_active = True
             pygame.mixer.music.pause()
         elif key == K_i:
-            self.__hero._money += 1
+            self.__hero.money += 1
 
     def update(self):
-        self.__kill_entities(self.__room._objects['entities'])
-        for portal in self.__room._objects['portals']:
+        self.__kill_entities(self.__room)
+        for portal in self.__room.nearby('portals', self.__hero.position.x-4/TILE_SIZE[0], self.__hero.position.y-20/TILE_SIZE[1], 35/TILE_SIZE[0], 47/TILE_SIZE[1]):
             if portal.is_active and (portal.position.x-31/TILE_SIZE[0] <= self.__hero.position.x <= portal.position.x+4/TILE_SIZE[0]) and (portal.position.y-27/TILE_SIZE[1] <= self.__hero.position.y <= portal.position.y+20/TILE_SIZE[1]):
-                self.__hero._position = deepcopy(portal.destination['position'])
-                self.__level = deepcopy(portal.destination['level'])
+                self.__hero._position = portal.destination['position'].copy()
+                self.__level = portal.destination['level']
                 Sounds().teleportation.play()
         
         self.__camera_pos = self.__hero.position.x // HORIZONTAL_TILES_COUNT, self.__hero.position.y // VERTICAL_TILES_COUNT
         try:
-            self.__room = self.__levels[self.__level][self.__camera_pos]
+            room = self.__world.room(self.__level, self.__camera_pos)
         except:
             raise SystemExit("Inaccessible territory!")
-        self.__room.update(self.__hero)
-        self.__hero.update()
+        if room is None:
+            raise SystemExit("Inaccessible territory!")
+        if room is not self.__room:
+            self.__scheduler.enter(room, self.__hero)
+            self.__room = room
+        with Profiler().section('room.update'):
+            self.__room.update(self.__hero)
+        with Profiler().section('hero.update'):
+            self.__hero.update()
+        with Profiler().section('background'):
+            self.__scheduler.tick(self.__world.rooms, self.__room, self.__hero)
+
+        self.__ticks += 1
+        if self.__autosave and AUTOSAVE_INTERVAL and self.__ticks % (AUTOSAVE_INTERVAL*60*self.__fps) == 0 and not Caretaker().saving:
+            self.save(self.__autosave_slot())
+
+    @staticmethod
+    def __autosave_slot():
+        # rolls over a few slots, so a save that goes wrong never takes the only autosave with it;
+        # an empty slot is filled first, then the one written longest ago is replaced
+        names = [f'autosave{slot}' for slot in range(1, AUTOSAVE_SLOTS+1)]
+        for name in names:
+            if name not in Caretaker():
+                return name
+        return min(names, key=lambda name: Caretaker().get_header(name)['timestamp'])
     
-    def render(self, screen):
-        screen.fill((35, 35, 35))
-        self.__room.render(screen)
-        self.__interface.render(screen, self.__hero)
-        self.__hero.render(screen)
-        pygame.display.flip()
+    def render(self, screen, alpha=1):
+        profiler = Profiler()
+        if not self.__dirty_rects:
+            with profiler.section('room.render'):
+                self.__room.render_background(screen)
+                self.__room.render_objects(screen, alpha)
+            with profiler.section('interface.render'):
+                self.__interface.render(screen, self.__hero)
+            self.__hero.render(screen, alpha)
+            profiler.render(screen)
+            with profiler.section('flip'):
+                pygame.display.flip()
+            return
+
+        full_redraw = self.__rendered_room is not self.__room
+        restore = self.__dirty
+        with profiler.section('room.render'):
+            if full_redraw:
+                self.__room.render_background(screen)
+            else:
+                if self.__interface.outdated(self.__hero):
+                    restore = restore + self.__interface.rects
+                for rect in restore:
+                    self.__room.render_background(screen, rect)
+            rects = self.__room.render_objects(screen, alpha)
+        with profiler.section('interface.render'):
+            hud = self.__interface.render(screen, self.__hero, None if full_redraw else restore+rects)
+        rects.append(self.__hero.render(screen, alpha))
+        overlay = profiler.render(screen)
+        if overlay is not None:
+            rects.append(overlay)
+
+        with profiler.section('flip'):
+            if full_redraw:
+                pygame.display.flip()
+            else:
+                pygame.display.update(restore + rects + hud)
+        self.__dirty = rects
+        self.__rendered_room = self.__room
+
+    def invalidate_screen(self):
+        self.__rendered_room = None
     
-    def save(self, savename):
-        with open('OOP_game/saves/'+savename, 'wb') as save:
-            data = {}
-
-            data.update({'hero':  self.__hero.save()})
-
-            levels = {}
-            for levelname in self.__levels:
-                leveldata = {}
-                for roomidx in self.__levels[levelname]:
-                    if self.__levels[levelname][roomidx] is not None:
-                        leveldata.update({roomidx: self.__levels[levelname][roomidx].save()})
-                    else:
-                        leveldata.update({roomidx: None})
-                levels.update({levelname: leveldata})
-
-            data.update({'map': levels})
-            data.update({'level': self.__level})
-            data.update({'room': self.__room.save()})
-
-            pickle.dump(data, save)
-            Caretaker().add_save(Memento(savename, data))
+    def save(self, savename, background=True):
+        # the snapshot is taken here; serializing, compressing and writing it happen on the save worker
+        data = {}
+
+        data.update({'hero':  self.__hero.save()})
+        # rooms that were never changed are left out and rebuilt from their level files when loading
+        data.update({'map': self.__world.save()})
+        data.update({'level': self.__level})
+
+        header = { 'level': self.__level,
+                   'hero':  { 'health':   float(self.__hero.health),
+                              'money':    self.__hero.money,
+                              'position': [self.__hero.position.x, self.__hero.position.y] } }
+        if background:
+            Caretaker().save_async(Memento(savename, data, header))
+        else:
+            Caretaker().add_save(Memento(savename, data, header))
     
     def load(self, data: dict):
-        levels = data['map']
-        for levelname in levels:
-            for roomidx in levels[levelname]:
-                if levels[levelname][roomidx] is not None:
-                    levels[levelname][roomidx] = Room.load(levels[levelname][roomidx])
-        self.__levels = levels
+        self.__world, _ = self.__create_world()
+        self.__world.restore(data['map'])
         self.__level = data['level']
-        self.__room = Room.load(data['room'])
         self.__hero = Hero.load(data['hero'])
+        self.__camera_pos = self.__hero.position.x // HORIZONTAL_TILES_COUNT, self.__hero.position.y // VERTICAL_TILES_COUNT
+        self.__room = self.__world.room(self.__level, self.__camera_pos)
+        self.__bargainer = None
+        self.__scheduler = BackgroundScheduler()
+
+    @staticmethod
+    def __create_world():
+        levels, start = LevelCompiler().build()
+        return World(levels), start
     
-    def __kill_entities(self, entity_lst, i=0):
-        if i == len(entity_lst):
-            return
-        
-        if entity_lst[i].isDead():
-            entity_lst.remove(entity_lst[i])
+    def __kill_entities(self, room: Room):
+        for entity in room.dead_entities():
+            room.remove('entities', entity)
             Sounds().death.play()
-            self.__kill_entities(entity_lst, i)
-        else:
-            self.__kill_entities(entity_lst, i+1)
     
     @property
     def fps(self):
@@ -165,18 +204,47 @@ class GameState:
     def bargainer(self):
         return self.__bargainer
 
+    def buy(self, slot):
+        # the bargainer's stock is saved with the room it stands in
+        self.__bargainer.sell(self.__hero, slot)
+        self.__room.modified = True
+
     @property
     def interface(self):
         return self.__interface
 
 
-class Menu(RenderableObject):
+class MenuObject(RenderableObject):
+    # menus are redrawn only after a key press or after being (re)opened, not every frame
+    def __init__(self, pos=None, size=TILE_SIZE):
+        super().__init__(pos, size)
+        self._is_active = False
+        self._needs_redraw = True
+
+    def redraw(self):
+        self._needs_redraw = True
+
+    @property
+    def needs_redraw(self):
+        return self._needs_redraw
+
+    @property
+    def is_active(self):
+        return self._is_active
+
+    @is_active.setter
+    def is_active(self, value):
+        if value and not self._is_active:
+            self._needs_redraw = True
+        self._is_active = value
+
+
+class Menu(MenuObject):
     def __init__(self):
         super().__init__(size=(WIDTH, HEIGHT))
         self.is_active = True
         self.__choice = 0
         self.section = 'Main menu'
-        self.__savename = ''
         self._image = pygame.transform.scale(Assets().pause_menu, self.size)
     
     def process_input(self, key, state: GameState):
@@ -197,15 +265,15 @@ class Menu(RenderableObject):
             if key == K_DOWN:
                 self.__choice += 1
                 Sounds().menu_selection.play()
-                if self.__choice > len(Caretaker().saves)-1:
+                if self.__choice > len(Caretaker())-1:
                     self.__choice = 0
             elif key == K_UP:
                 self.__choice -= 1
                 Sounds().menu_selection.play()
                 if self.__choice < 0:
-                    self.__choice = len(Caretaker().saves)-1
-            elif key == K_RETURN:
-                state.load(Caretaker().get_save(self.__savename))
+                    self.__choice = max(len(Caretaker())-1, 0)
+            elif key == K_RETURN and len(Caretaker()):
+                state.load(Caretaker().get_save(Caretaker().header(self.__choice)['name']))
                 self.__choice = 0
                 self.section = 'Main menu'
                 self.is_active = False
@@ -222,30 +290,35 @@ class Menu(RenderableObject):
         pass
     
     def render(self, screen):
-        font = pygame.font.SysFont('Bahnschrift', 24)
         sections = ['New game', 'Load save', 'Hotkeys', 'Authors', 'Exit']
-        pointer = font.render('<', False, WHITE)
+        pointer = Text().render('<', *MENU_FONT)
         
         screen.fill(BLACK)
         if self.section == 'Main menu':
             for i in range(len(sections)):
-                text = font.render(sections[i], False, WHITE)
+                text = Text().render(sections[i], *MENU_FONT)
                 screen.blit(text, pygame.Rect((15, HEIGHT//2-100+30*i), (text.get_width(), text.get_height())))
                 if i == self.__choice:
                     screen.blit(pointer, pygame.Rect((40+text.get_width(), HEIGHT//2-100+30*i), (pointer.get_width(), pointer.get_height())))
         elif self.section == 'Load save':
-            for i in range(len(Caretaker().saves)):
-                text = font.render(list(Caretaker().saves.keys())[i], False, WHITE)
+            # newest first, one page at a time around the selected save
+            page = self.__choice // SAVES_PER_PAGE
+            headers = Caretaker().page(page)
+            for i in range(len(headers)):
+                text = Text().render(headers[i]['name'], *MENU_FONT)
                 screen.blit(text, pygame.Rect((25, 15+30*i), (text.get_width(), text.get_height())))
-                if i == self.__choice:
-                    self.__savename = list(Caretaker().saves.keys())[i]
+                if page*SAVES_PER_PAGE+i == self.__choice:
                     screen.blit(pointer, pygame.Rect((50+text.get_width(), 15+30*i), (pointer.get_width(), pointer.get_height())))
+            if len(Caretaker()) > SAVES_PER_PAGE:
+                pages = Text().render(f'{page+1}/{(len(Caretaker())-1)//SAVES_PER_PAGE+1}', *MENU_FONT)
+                screen.blit(pages, pygame.Rect((25, 15+30*SAVES_PER_PAGE), (pages.get_width(), pages.get_height())))
         elif self.section == 'Hotkeys':
             pass
         elif self.section == 'Authors':
             pass
         
         pygame.display.flip()
+        self._needs_redraw = False
         
     def __select(self, state: GameState):
         if self.__choice == 0:
@@ -259,6 +332,7 @@ class Menu(RenderableObject):
         elif self.__choice == 3:
             self.section = 'Authors'
         elif self.__choice == 4:
+            Caretaker().wait()
             exit()
         self.__choice = 0
         Sounds().select.play()
@@ -268,7 +342,7 @@ class Menu(RenderableObject):
         return self._image
 
 
-class PauseMenu(RenderableObject):
+class PauseMenu(MenuObject):
     def __init__(self):
         super().__init__(pos=Position(WIDTH//2-PAUSE_MENU_SIZE[0]//2, HEIGHT//2-PAUSE_MENU_SIZE[1]//2), size=PAUSE_MENU_SIZE)
         self.is_active = False
@@ -312,24 +386,24 @@ class PauseMenu(RenderableObject):
         pass
 
     def render(self, screen):
-        font = pygame.font.SysFont('Bahnschrift', 24)
         if self.section == 'pause':
             sections = ['Continue', 'Save', 'Main menu']
-            pointer = font.render('<', False, WHITE)
+            pointer = Text().render('<', *MENU_FONT)
 
             screen.blit(self.image, pygame.Rect((self.position.x, self.position.y), self.size))        
             for i in range(len(sections)):
-                text = font.render(sections[i], False, WHITE)
+                text = Text().render(sections[i], *MENU_FONT)
                 screen.blit(text, pygame.Rect((self.position.x+(self.size[0]-text.get_width())//2, self.position.y+15+30*i), (text.get_width(), text.get_height())))
                 if i == self.__choice:
                     screen.blit(pointer, pygame.Rect((self.position.x+self.size[0]//2+text.get_width()//2+15, self.position.y+15+30*i), (pointer.get_width(), pointer.get_height())))
         elif self.section == 'save':
-            text = font.render('Save: '+self.__savename, False, WHITE)
+            text = Text().render('Save: '+self.__savename, *MENU_FONT)
 
             screen.blit(Assets().savename_input, pygame.Rect(((WIDTH-SAVENAME_INPUT[0])//2, HEIGHT-SAVENAME_INPUT[1]-10), SAVENAME_INPUT))
             screen.blit(text, pygame.Rect(((WIDTH-text.get_width())//2, HEIGHT-SAVENAME_INPUT[1]), (text.get_width(), text.get_height())))
         
         pygame.display.flip()
+        self._needs_redraw = False
 
     def __select(self, menu: Menu):
         if self.__choice == 0:
@@ -348,7 +422,7 @@ class PauseMenu(RenderableObject):
         return self._image
 
 
-class ShopMenu(RenderableObject):
+class ShopMenu(MenuObject):
     def __init__(self):
         super().__init__(pos=Position(WIDTH//2-SHOP_MENU_SIZE[0]//2, HEIGHT//2-SHOP_MENU_SIZE[1]//2), size=SHOP_MENU_SIZE)
         self.is_active = False
@@ -373,7 +447,7 @@ class ShopMenu(RenderableObject):
             if self.__slot > 9:
                 self.__slot = 1
         elif key == K_RETURN:
-            state.bargainer.sell(state.hero, self.__slot)
+            state.buy(self.__slot)
         elif key == K_ESCAPE:
             self.is_active = False
 
@@ -391,6 +465,7 @@ class ShopMenu(RenderableObject):
         screen.blit(image, rect)
 
         pygame.display.flip()
+        self._needs_redraw = False
 
     @property
     def image(self):
@@ -0,0 +1,115 @@
+import os
+import random
+import argparse
+import pygame
+from time import perf_counter
+from pygame.locals import *
+from constants import WIDTH, HEIGHT
+from sounds import Sounds
+from gamestates import GameState, PauseMenu, ShopMenu
+from levelcompiler import LevelCompiler
+from objects import Room, Hero, Bargainer
+
+
+class HeadlessGame:
+    # drives GameState without a window, audio or frame cap: input comes from the caller, one key per step
+    def __init__(self, render=False, fps=60):
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        pygame.mixer.init()
+        pygame.init()
+        self.__screen = pygame.display.set_mode((WIDTH, HEIGHT) if render else (1, 1))
+        # Sounds is a singleton and may have been created unmuted already
+        Sounds(muted=True).mute()
+
+        # runs here are tests and measurements, which must not replace the player's autosaves
+        self.__state = GameState(fps, autosave=False)
+        self.__pause_menu = PauseMenu()
+        self.__shop_menu = ShopMenu()
+        self.__render = render
+        self.__steps = 0
+
+    def step(self, key=0):
+        self.__state.process_input(key, self.__state.interface.active_slot, self.__pause_menu, self.__shop_menu)
+        # menus are not simulated, a key that would open one is simply swallowed
+        self.__pause_menu.is_active = False
+        self.__shop_menu.is_active = False
+        self.__state.update()
+        if self.__render:
+            self.__state.render(self.__screen)
+        self.__steps += 1
+
+    def run(self, inputs, steps=None):
+        inputs = iter(inputs)
+        done = 0
+        while steps is None or done < steps:
+            key = next(inputs, None)
+            if key is None:
+                if steps is None:
+                    break
+                key = 0
+            self.step(key)
+            done += 1
+        return done
+
+    @property
+    def state(self):
+        return self.__state
+
+    @property
+    def screen(self):
+        return self.__screen
+
+    @property
+    def steps(self):
+        return self.__steps
+
+
+def random_inputs(seed=0):
+    keys = [K_LEFT, K_RIGHT, K_UP, K_DOWN, K_f, K_q, K_g, K_1, 0]
+    rng = random.Random(seed)
+    while True:
+        key = rng.choice(keys)
+        for _ in range(rng.randint(1, 30)):
+            yield key
+
+
+def check_levels(state):
+    # every compiled room loads, each bargainer in it can be asked for every shop slot,
+    # and the hero can step through each portal and land in a room that exists
+    levels, start = LevelCompiler().build()
+    checked = 0
+    for level in levels:
+        for index, filename in levels[level].items():
+            if filename is None:
+                continue
+            room = Room.create(filename)
+            for entity in room._objects['entities']:
+                if isinstance(entity, Bargainer):
+                    entity.empty_slot()
+                    for slot in range(1, 10):
+                        entity.sell(Hero(), slot)
+                    checked += 1
+            for portal in room._objects['portals']:
+                state.load({'map': {}, 'level': level, 'hero': Hero(pos=portal.position.copy()).save()})
+                state.update()
+                if (state.hero.position.x, state.hero.position.y) != (portal.destination['position'].x, portal.destination['position'].y):
+                    raise SystemExit(f'Portal at {portal.position} in {level} {index} did not take the hero anywhere')
+                checked += 1
+    return checked
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the game simulation without a display.')
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--render', action='store_true')
+    parser.add_argument('--check-levels', action='store_true', help='load every compiled room and trade with its bargainers')
+    args = parser.parse_args()
+
+    game = HeadlessGame(render=args.render)
+    if args.check_levels:
+        print(f'{check_levels(game.state)} bargainers and portals checked')
+    start = perf_counter()
+    game.run(random_inputs(args.seed), args.steps)
+    elapsed = perf_counter() - start
+    print(f'{args.steps} steps in {elapsed:.3f}s ({args.steps/elapsed:.0f} steps/s)')
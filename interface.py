@@ -2,7 +2,7 @@ import pygame
 from pygame.locals import *
 from Singleton import SingletonMeta
 from objects import RenderableObject, Hero, Position
-from utils import Assets
+from utils import Assets, Text
 from constants import *
 
 
@@ -20,7 +20,7 @@ class InventoryBar(RenderableObject):
             image.blit(Assets().active_slot, pygame.Rect((SLOT_SIZE[1]*(active_slot-1), 0), SLOT_SIZE))
         rect = image.get_rect()
         rect.topleft = self.position.x, self.position.y
-        screen.blit(image, rect)
+        return screen.blit(image, rect)
 
     @property
     def image(self):
@@ -34,8 +34,7 @@ class EquipmentBar(RenderableObject):
 
     def render(self, screen, active_slot, inventory):
         image = pygame.transform.scale(self.image, self.size)
-        for i in range(4):
-            item = list(inventory.values())[i]
+        for i, item in enumerate(inventory.values()):
             if item is not None:
                 image.blit(item.image, pygame.Rect((6, SLOT_SIZE[1]*(i)+6), item.size))
         if active_slot is not None and isinstance(active_slot, str):
@@ -43,7 +42,7 @@ class EquipmentBar(RenderableObject):
             image.blit(Assets().active_slot, pygame.Rect((0, SLOT_SIZE[1]*slot_number), SLOT_SIZE))
         rect = image.get_rect()
         rect.topleft = self.position.x, self.position.y
-        screen.blit(image, rect)
+        return screen.blit(image, rect)
 
     @property
     def image(self):
@@ -67,6 +66,7 @@ class HealthBar(RenderableObject):
         if health % 1 != 0:
             rect.topleft = self.position.x + int(health)*(self.size[0]+4), self.position.y
             screen.blit(Assets().halfHeart, rect)
+        return pygame.Rect((self.position.x, self.position.y), ((self.size[0]+4)*Hero.MAX_HEALTH, self.size[1]))
     
     @property
     def image(self):
@@ -84,6 +84,7 @@ class ArmorBar(RenderableObject):
         for i in range(armor):
             rect.topleft = self.position.x + i*(self.size[0]+4), self.position.y
             screen.blit(image, rect)
+        return pygame.Rect((self.position.x, self.position.y), ((self.size[0]+4)*armor, self.size[1]))
 
     @property
     def image(self):
@@ -96,10 +97,9 @@ class Coin(RenderableObject):
         self._image = Assets().coin
 
     def render(self, screen, money):
-        font = pygame.font.SysFont('Bahnschrift', 14)
-        text = font.render(f': {money}', True, WHITE)
-        screen.blit(self._image, pygame.Rect((self.position.x, self.position.y), self.size))
-        screen.blit(text, (self.position.x+20, self.position.y-1))
+        text = Text().render(f': {money}', *HUD_FONT, WHITE, True)
+        rect = screen.blit(self._image, pygame.Rect((self.position.x, self.position.y), self.size))
+        return rect.union(screen.blit(text, (self.position.x+20, self.position.y-1)))
 
     @property
     def image(self):
@@ -114,13 +114,44 @@ class UserInterface(metaclass=SingletonMeta):
         self._health_bar = HealthBar()
         self._armor_bar = ArmorBar()
         self._coin = Coin()
+        self._hud = None
+        self._hud_state = None
+        self._rects = []
+
+    def outdated(self, hero: Hero):
+        return self._hud_state != (hero, hero.version, self._active_slot)
+
+    def render(self, screen, hero: Hero, areas=None):
+        # the HUD is composited once per change of the hero's state or the active slot;
+        # with areas given only those parts of it are redrawn, and the changed rects are returned
+        changed = self.outdated(hero)
+        if changed:
+            self.__compose(screen, hero)
+
+        if areas is None or changed:
+            for rect in self._rects:
+                screen.blit(self._hud, rect, rect)
+            return list(self._rects)
+
+        for area in areas:
+            for rect in self._rects:
+                clip = rect.clip(area)
+                if clip:
+                    screen.blit(self._hud, clip, clip)
+        return []
+
+    def __compose(self, screen, hero: Hero):
+        self._hud = pygame.Surface(screen.get_size(), pygame.SRCALPHA)
+        self._rects = [ self._inventory_bar.render(self._hud, self._active_slot, hero._inventory['items']),
+                        self._equipment_bar.render(self._hud, self._active_slot, hero._inventory['equipment']),
+                        self._health_bar.render(self._hud, hero.health),
+                        self._armor_bar.render(self._hud, hero._armor),
+                        self._coin.render(self._hud, hero.money) ]
+        self._hud_state = (hero, hero.version, self._active_slot)
 
-    def render(self, screen, hero: Hero):
-        self._inventory_bar.render(screen, self._active_slot, hero._inventory['items'])
-        self._equipment_bar.render(screen, self._active_slot, hero._inventory['equipment'])
-        self._health_bar.render(screen, hero.health)
-        self._armor_bar.render(screen, hero._armor)
-        self._coin.render(screen, hero._money)
+    @property
+    def rects(self):
+        return self._rects
     
     @property
     def active_slot(self):
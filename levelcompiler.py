@@ -0,0 +1,114 @@
+import os
+import json
+import struct
+import hashlib
+import argparse
+import numpy as np
+from utils import write_atomically
+from constants import *
+
+
+MAGIC = b'OOPL'
+VERSION = 1
+# magic, version, grid height, grid width, length of the JSON object placements
+HEADER = struct.Struct('<4sHHHI')
+
+
+def parse_terrain(lines):
+    terrain = np.full((int(VERTICAL_TILES_COUNT), int(HORIZONTAL_TILES_COUNT)), EMPTY_TILE, dtype=np.uint8)
+    for y, line in enumerate(lines):
+        codes = [ord(type) for type in line]
+        terrain[y, :len(codes)] = codes
+    return terrain
+
+
+def solid_codes():
+    codes = np.zeros(256, dtype=bool)
+    for type in SOLID_TILES:
+        codes[ord(type)] = True
+    return codes
+
+
+def compile_room(lines, objects):
+    terrain = parse_terrain(lines)
+    placements = json.dumps(objects, separators=(',', ':')).encode()
+
+    height, width = terrain.shape
+    return HEADER.pack(MAGIC, VERSION, height, width, len(placements)) + terrain.tobytes() + solid_codes()[terrain].tobytes() + placements
+
+
+def read_room(filename):
+    # the grids are copy-on-write views of the mapped file, so nothing is parsed or copied until a tile changes
+    data = np.memmap(filename, dtype=np.uint8, mode='c')
+    magic, version, height, width, length = HEADER.unpack(data[:HEADER.size].tobytes())
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{filename} is not a compiled level of version {VERSION}')
+
+    start = HEADER.size
+    terrain = data[start:start+height*width].reshape(height, width)
+    start += height*width
+    solid = data[start:start+height*width].reshape(height, width).view(bool)
+    start += height*width
+    objects = json.loads(data[start:start+length].tobytes())
+    return terrain, solid, objects
+
+
+class LevelCompiler:
+    # compiled rooms are cached under a directory named after the hash of the manifest, the maps, the tile
+    # constants baked into them and the format version
+    def __init__(self, manifest=LEVEL_MANIFEST, build=LEVEL_BUILD):
+        self.__manifest = manifest
+        self.__build = build
+
+    def build(self):
+        with open(self.__manifest, 'rb') as manifest:
+            source = manifest.read()
+        description = json.loads(source)
+        maps = os.path.dirname(self.__manifest)
+
+        digest = hashlib.sha256(source)
+        digest.update(str(VERSION).encode())
+        # the collision mask and the grid are baked into the compiled rooms too
+        digest.update(repr((SOLID_TILES, EMPTY_TILE, HORIZONTAL_TILES_COUNT, VERTICAL_TILES_COUNT)).encode())
+        for level in description['levels']:
+            for room in description['levels'][level]:
+                if room['map'] is not None:
+                    with open(os.path.join(maps, room['map']), 'rb') as map:
+                        digest.update(map.read())
+        directory = os.path.join(self.__build, digest.hexdigest())
+
+        levels = {}
+        for level in description['levels']:
+            levels[level] = {}
+            for room in description['levels'][level]:
+                index = tuple(room['room'])
+                levels[level][index] = None if room['map'] is None else os.path.join(directory, f'{level}.{index[0]}_{index[1]}{COMPILED_LEVEL_EXTENSION}')
+
+        if not os.path.isdir(directory):
+            write_atomically(directory, lambda temporary: self.__compile(description, maps, levels, temporary))
+        return levels, description['start']
+
+    @staticmethod
+    def __compile(description, maps, levels, temporary):
+        os.makedirs(temporary)
+        for level in description['levels']:
+            for room in description['levels'][level]:
+                if room['map'] is None:
+                    continue
+                with open(os.path.join(maps, room['map'])) as map:
+                    lines = [line.strip('\n') for line in map.readlines()]
+                filename = os.path.basename(levels[level][tuple(room['room'])])
+                with open(os.path.join(temporary, filename), 'wb') as output:
+                    output.write(compile_room(lines, room.get('objects', {})))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the level manifest and maps into the binary level cache')
+    parser.add_argument('--manifest', default=LEVEL_MANIFEST)
+    parser.add_argument('--build', default=LEVEL_BUILD)
+    args = parser.parse_args()
+
+    levels, start = LevelCompiler(args.manifest, args.build).build()
+    for level in levels:
+        for index in levels[level]:
+            print(level, index, levels[level][index])
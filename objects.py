@@ -1,12 +1,20 @@
 import pygame
 from abc import ABC, abstractmethod
-from utils import Spritesheet, Assets
+from utils import Assets
 from sounds import Sounds
 from constants import *
-from copy import deepcopy
+from math import floor, ceil
+from spatial import SpatialHash
+from swarm import PirateSwarm
+from pathfinding import FlowField
+from levelcompiler import parse_terrain, solid_codes, read_room
+from serializer import serializable, value_type, restore
+import numpy as np
 
 
 class Position:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -14,26 +22,59 @@ class Position:
     def __repr__(self):
         return f'{self.x}, {self.y}'
 
+    def copy(self):
+        return Position(self.x, self.y)
+
+    # pickled as the same {'x': ..., 'y': ...} state as before slots, so old saves still load
+    def __getstate__(self):
+        return {'x': self.x, 'y': self.y}
+
+    def __setstate__(self, state):
+        self.x = state['x']
+        self.y = state['y']
+
+
+value_type(Position, 'dd', lambda position: (position.x, position.y), Position)
+
 
 class SavableObject(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def save(self):
         pass
 
 
 class RenderableObject(ABC):
-    def __init__(self, pos=Position(0, 0), size=TILE_SIZE):
-        self._position = pos
+    __slots__ = ('_position', '__size', '_previous_position')
+
+    def __init__(self, pos=None, size=TILE_SIZE):
+        self._position = pos if pos is not None else Position(0, 0)
         self.__size = size
+        self._previous_position = None
     
     def update(self):
         pass
 
-    def render(self, screen):
+    def render(self, screen, alpha=1):
         image = self.image
         rect = image.get_rect()
-        rect.topleft = self.position.x % HORIZONTAL_TILES_COUNT * TILE_SIZE[0] + LEFT_SPACE, self.position.y % VERTICAL_TILES_COUNT * TILE_SIZE[1] + TOP_SPACE
-        screen.blit(image, rect)
+        rect.topleft = self.screen_position(alpha)
+        return screen.blit(image, rect)
+
+    def remember_position(self):
+        self._previous_position = (self._position.x, self._position.y)
+
+    def screen_position(self, alpha=1):
+        # alpha blends between the positions before and after the last simulation tick
+        x, y = self._position.x, self._position.y
+        if alpha < 1 and self._previous_position is not None:
+            previous_x, previous_y = self._previous_position
+            # room changes and teleports are drawn as jumps
+            if abs(x-previous_x) < 1 and abs(y-previous_y) < 1:
+                x = previous_x + (x-previous_x)*alpha
+                y = previous_y + (y-previous_y)*alpha
+        return x % HORIZONTAL_TILES_COUNT * TILE_SIZE[0] + LEFT_SPACE, y % VERTICAL_TILES_COUNT * TILE_SIZE[1] + TOP_SPACE
 
     @property
     def position(self):
@@ -43,6 +84,10 @@ class RenderableObject(ABC):
     def size(self):
         return self.__size
 
+    @property
+    def size_in_tiles(self):
+        return self.__size[0]/TILE_SIZE[0], self.__size[1]/TILE_SIZE[1]
+
     @property
     @abstractmethod
     def image(self):
@@ -50,6 +95,9 @@ class RenderableObject(ABC):
 
 
 class AnimatedObject(ABC):
+    # slotted by the concrete classes: two bases with slot layouts cannot be mixed
+    __slots__ = ()
+
     def __init__(self, current_animation='move'):
         self._current_animation = current_animation
         self._frame = 0
@@ -59,8 +107,11 @@ class AnimatedObject(ABC):
         return self._frame
 
 
+@serializable(('name', 's'), ('price', 'q'), ('position', 'P'))
 class Item(RenderableObject, SavableObject):
-    def __init__(self, name='', price=0, pos=Position(0, 0)):
+    __slots__ = ('__name', '__price')
+
+    def __init__(self, name='', price=0, pos=None):
         super().__init__(pos)
         self.__name = name
         self.__price = price
@@ -70,7 +121,7 @@ class Item(RenderableObject, SavableObject):
         data.update({'objtype': 'Item'})
         data.update({'name': self.name})
         data.update({'price': self.price})
-        data.update({'position': self.position})
+        data.update({'position': self.position.copy()})
         return data
     
     @staticmethod
@@ -89,38 +140,46 @@ class Item(RenderableObject, SavableObject):
 
     @property
     def image(self):
-        return pygame.transform.scale2x(Assets().items[self.name])
+        return Assets().transform(Assets().items[self.name], scale2x=True)
 
 
-class Tile(RenderableObject, SavableObject):
-    def __init__(self, type, pos=Position(0, 0)):
-        super().__init__(pos)
-        self._type = type
-    
-    def save(self):
-        data = {}
-        data.update({'objtype': 'Tile'})
-        data.update({'type': self.type})
-        data.update({'position': self.position})
-        return data
-    
+class Tile:
+    # one shared instance per tile character; rooms only keep a grid of character codes
+    __slots__ = ('__type', '__solid')
+    __tiles = {}
+
+    def __init__(self, type):
+        self.__type = type
+        self.__solid = type in SOLID_TILES
+
     @staticmethod
-    def load(data):
-        return Tile( type=data['type'],
-                     pos=data['position'] )
+    def of(code):
+        if code == EMPTY_TILE:
+            return None
+        tile = Tile.__tiles.get(code)
+        if tile is None:
+            tile = Tile(chr(code))
+            Tile.__tiles[code] = tile
+        return tile
+
     
     @property
     def type(self):
-        return self._type
+        return self.__type
+
+    @property
+    def solid(self):
+        return self.__solid
     
     @property
     def image(self):
-        return pygame.transform.scale(Assets().tiles[self._type], TILE_SIZE)
+        return Assets().transform(Assets().tiles[self.__type], TILE_SIZE)
 
 
 class Room(SavableObject):
-    def __init__(self, tileset, objects=None):
-        self._tiles = tileset
+    def __init__(self, terrain, objects=None, solid=None):
+        self._terrain = terrain
+        self._solid_mask = solid
         if objects is None:
             self._objects = { 'entities': [],
                               'objects':  [],
@@ -128,33 +187,82 @@ class Room(SavableObject):
                               'portals':  [] }
         else:
             self._objects = objects
+        self._background = None
+        self._hero = None
+        self._near_hero = None
+        self._swarm = None
+        self._generation = 0
+        self._swarm_generation = None
+        self._modified = False
+        self._flow_fields = {}
+        self._index = {}
+        for category in self._objects:
+            self._index[category] = SpatialHash()
+            for obj in self._objects[category]:
+                self._index[category].insert(obj)
+        self.__build_grid(solid)
+
+    def __build_grid(self, solid=None):
+        self._solid_mask = solid_codes()[self._terrain] if solid is None else solid
+        self._solid = self._solid_mask.tolist()
     
-    def update(self, hero):
-        for tile in self._tiles:
-            tile.update()
+    def update(self, hero, visible=True):
+        # rooms the hero is not in only animate: no monster notices the hero through a room boundary
+        self._near_hero = None if visible else frozenset()
+        self._hero = hero
+        swarm = self.__swarm()
+        if swarm is not None:
+            swarm.update(hero, self, visible)
 
         for category in self._objects:
             for obj in self._objects[category]:
+                if swarm is not None and obj in swarm:
+                    continue
+                obj.remember_position()
                 if isinstance(obj, Monster):
-                    obj.update(hero)
+                    obj.update(hero, self)
                 else:
                     obj.update()
 
-    def render(self, screen):
-        for tile in self._tiles:
-            tile.render(screen)
-
+    def __swarm(self):
+        # rooms with many pirates step them in one batch; the entities are only scanned again after objects were added or removed
+        if self._swarm_generation != self._generation:
+            pirates = [entity for entity in self._objects['entities'] if isinstance(entity, Pirate)]
+            self._swarm = PirateSwarm(pirates) if len(pirates) >= SWARM_THRESHOLD else None
+            self._swarm_generation = self._generation
+        return self._swarm
+
+    def render(self, screen, alpha=1):
+        self.render_background(screen)
+        self.render_objects(screen, alpha)
+
+    def render_background(self, screen, area=None):
+        if self._background is None:
+            self._background = self.__bake(screen)
+        if area is None:
+            return screen.blit(self._background, (0, 0))
+        return screen.blit(self._background, area, area)
+
+    def render_objects(self, screen, alpha=1):
+        rects = []
         for category in self._objects:
             for obj in self._objects[category]:
-                obj.render(screen)
+                rects.append(obj.render(screen, alpha))
+        return rects
+
+    def invalidate_background(self):
+        self._background = None
+
+    def __bake(self, screen):
+        background = pygame.Surface(screen.get_size(), 0, screen)
+        background.fill(GREY)
+        for y, x in zip(*np.nonzero(self._terrain)):
+            background.blit(Tile.of(self._terrain[y, x]).image, (x*TILE_SIZE[0] + LEFT_SPACE, y*TILE_SIZE[1] + TOP_SPACE))
+        return background
     
     def save(self):
         data = {}
-        
-        tileset = []
-        for tile in self._tiles:
-            tileset.append(tile.save())
-        data.update({'tiles': tileset})
+        data.update({'terrain': [''.join(map(chr, row)) for row in self._terrain.tolist()]})
 
         objects = {}
         for category in self._objects:
@@ -167,54 +275,185 @@ class Room(SavableObject):
         return data
     
     @staticmethod
-    def load(data):
-        tileset = []
-        for tiledata in data['tiles']:
-            tileset.append(Tile.load(tiledata))
+    def load(data, terrain=None):
+        if terrain is None:
+            if 'terrain' in data:
+                terrain = parse_terrain(data['terrain'])
+            else:
+                # saves made before terrain grids stored one dict per tile
+                terrain = parse_terrain([])
+                for tiledata in data['tiles']:
+                    terrain[int(tiledata['position'].y), int(tiledata['position'].x)] = ord(tiledata['type'])
         
         objects = {}
         for category in data['objects']:
             category_objects = []
             for objdata in data['objects'][category]:
-                if objdata['objtype'] == 'Item':
-                    category_objects.append(Item.load(objdata))
-                elif objdata['objtype'] == 'Armor':
-                    category_objects.append(Armor.load(objdata))
-                elif objdata['objtype'] == 'Bargainer':
-                    category_objects.append(Bargainer.load(objdata))
-                elif objdata['objtype'] == 'Portal':
-                    category_objects.append(Portal.load(objdata))
-                elif objdata['objtype'] == 'Pirate':
-                    category_objects.append(Pirate.load(objdata))
+                obj = Room.load_object(objdata)
+                if obj is not None:
+                    category_objects.append(obj)
             objects.update({category: category_objects})
                 
-        return Room(tileset, objects)
+        return Room(terrain, objects)
+
+    @staticmethod
+    def load_object(objdata):
+        # every saved class registers its loader with @serializable
+        return restore(objdata)
         
     @staticmethod
     def create(filename):
         try:
+            if filename.endswith(COMPILED_LEVEL_EXTENSION):
+                return Room.compiled(filename)
+
             with open(filename) as room:
                 room_data = room.readlines()
             
-            tileset = []
-            for y in range(len(room_data)):
-                line = room_data[y].strip('\n')
-                for x in range(len(line)):
-                    tileset.append(Tile(line[x], Position(x, y)))
-            
-            return Room(tileset)
+            return Room(parse_terrain(line.strip('\n') for line in room_data))
         except:
             raise SystemError(f'Unable to load room {filename}')
-    
+
+    @staticmethod
+    def compiled(filename):
+        terrain, solid, placements = read_room(filename)
+        room = Room(terrain, solid=solid)
+        for category in placements:
+            for objdata in placements[category]:
+                room.add(category, Room.load_object(Room.__decode(objdata)))
+        room.modified = False
+        return room
+
+    @staticmethod
+    def __decode(objdata):
+        # level manifests are JSON: positions are [x, y] pairs and slot numbers are strings
+        decoded = {}
+        for key, value in objdata.items():
+            if key == 'position':
+                value = Position(*value)
+            elif key == 'destination':
+                value = Room.__decode(value)
+            elif key == 'items':
+                value = {int(slot): None if item is None else Room.__decode(item) for slot, item in value.items()}
+            decoded[key] = value
+        return decoded
+    
+    def add(self, category, obj):
+        self._objects[category].append(obj)
+        self._index[category].insert(obj)
+        self._generation += 1
+        self._modified = True
+
+    def remove(self, category, obj):
+        self._objects[category].remove(obj)
+        self._index[category].remove(obj)
+        self._generation += 1
+        self._modified = True
+
+    def hit(self, entity, damage):
+        entity._health -= damage
+        self._modified = True
+        if self._swarm is not None and entity in self._swarm:
+            self._swarm.hit(entity, damage)
+
+    def dead_entities(self):
+        if self._swarm is None:
+            return [entity for entity in self._objects['entities'] if entity.isDead()]
+        dead = self._swarm.dead()
+        return dead + [entity for entity in self._objects['entities'] if entity not in self._swarm and entity.isDead()]
+
+    def relocate(self, obj):
+        # only monsters chasing the hero move, so this only happens in the room the hero is in
+        self._modified = True
+        for index in self._index.values():
+            if obj in index:
+                index.update(obj)
+
+    def nearby(self, category, x, y, width, height):
+        return self._index[category].query(x, y, width, height)
+
+    def flow_field(self, size, hero):
+        field = self._flow_fields.get(size)
+        if field is None:
+            field = FlowField(self._solid_mask, size)
+            self._flow_fields[size] = field
+        height, width = self._solid_mask.shape
+        x, y = hero.position.x % HORIZONTAL_TILES_COUNT, hero.position.y % VERTICAL_TILES_COUNT
+        field.update( (col, row) for row in range(floor(y), min(ceil(y+HERO_SIZE_IN_TILES[1]), height))
+                                 for col in range(floor(x), min(ceil(x+HERO_SIZE_IN_TILES[0]), width)) )
+        return field
+
+    def near_hero(self, obj):
+        if self._near_hero is None:
+            hero = self._hero
+            self._near_hero = set(self.nearby('entities', hero.position.x-AGGRO_RADIUS, hero.position.y-AGGRO_RADIUS, 2*AGGRO_RADIUS, 2*AGGRO_RADIUS))
+        return obj in self._near_hero
+
+    @property
+    def terrain(self):
+        return self._terrain
+
+    # whether the room has changed since it was created or loaded, i.e. must be saved to be restored
+    @property
+    def modified(self):
+        return self._modified
+
+    @modified.setter
+    def modified(self, value):
+        self._modified = value
+
+    @terrain.setter
+    def terrain(self, terrain):
+        self._terrain = terrain
+        self.__build_grid()
+        self._flow_fields = {}
+        self.invalidate_background()
+
     def tileOn(self, pos: Position):
-        for tile in self._tiles:
-            if tile.position.x == pos.x and tile.position.y == pos.y:
-                return tile
-        return None
+        return Tile.of(self._terrain[int(pos.y) % int(VERTICAL_TILES_COUNT), int(pos.x) % int(HORIZONTAL_TILES_COUNT)])
+
+    def is_solid(self, x, y):
+        return self._solid[floor(y) % int(VERTICAL_TILES_COUNT)][floor(x) % int(HORIZONTAL_TILES_COUNT)]
+
+    def collides(self, x, y, width, height):
+        for row in range(floor(y), ceil(y+height)):
+            for col in range(floor(x), ceil(x+width)):
+                if self.is_solid(col, row):
+                    return True
+        return False
+
+    def collides_many(self, x, y, width, height):
+        # collides() for arrays of boxes at once
+        height_tiles, width_tiles = self._solid_mask.shape
+        first_col, first_row = np.floor(x).astype(int), np.floor(y).astype(int)
+        cols = np.ceil(x+width).astype(int) - first_col
+        rows = np.ceil(y+height).astype(int) - first_row
+        result = np.zeros(x.shape, dtype=bool)
+        for col in range(int(cols.max(initial=0))):
+            for row in range(int(rows.max(initial=0))):
+                inside = (col < cols) & (row < rows)
+                result |= inside & self._solid_mask[(first_row+row) % height_tiles, (first_col+col) % width_tiles]
+        return result
+
+    def can_move(self, pos: Position, size, step_x=0, step_y=0):
+        # only the strip swept by the step is tested, so an object that
+        # already overlaps a wall (e.g. right after a room transition) can still walk out of it
+        width, height = size
+        if step_x > 0:
+            return not self.collides(pos.x+width, pos.y, step_x, height)
+        elif step_x < 0:
+            return not self.collides(pos.x+step_x, pos.y, -step_x, height)
+        elif step_y > 0:
+            return not self.collides(pos.x, pos.y+height, width, step_y)
+        elif step_y < 0:
+            return not self.collides(pos.x, pos.y+step_y, width, -step_y)
+        return True
 
 
 class Entity(RenderableObject, AnimatedObject, SavableObject, ABC):
-    def __init__(self, name='', hlth=100, dmg=0, armor=0, pos=Position(0, 0), size=(32, 32), current_animation='move'):
+    __slots__ = ('_current_animation', '_frame', '__name', '_health', '_damage', '_armor', '_image')
+
+    def __init__(self, name='', hlth=100, dmg=0, armor=0, pos=None, size=(32, 32), current_animation='move'):
         super(Entity, self).__init__(pos, size)
         super(RenderableObject, self).__init__(current_animation)
         self.__name = name
@@ -235,10 +474,13 @@ class Entity(RenderableObject, AnimatedObject, SavableObject, ABC):
     
 
 
+@serializable( ('name', 's'), ('health', 'd'), ('damage', 'd'), ('armor', 'q'), ('position', 'P'),
+               ('money', 'q'), ('inventory', 'v'), ('effects', 'v'), ('side', 'B') )
 class Hero(Entity):
     MAX_HEALTH = 7
+    __slots__ = ('_money', '_inventory', '_effects', '__attack_count', '__side', '__version')
 
-    def __init__( self, name='', health=MAX_HEALTH, damage=3, armor=0, pos=Position(0, 0), money=0, inventory=None, effects=None, side=RIGHT):
+    def __init__( self, name='', health=MAX_HEALTH, damage=3, armor=0, pos=None, money=0, inventory=None, effects=None, side=RIGHT):
         super().__init__(name, health, damage, armor, pos)
         self._money = money
         if inventory is None:
@@ -266,7 +508,8 @@ class Hero(Entity):
             self._effects = effects
         self.__attack_count = 0
         self.__side = side
-        self._image = pygame.transform.scale(Assets().hero_animations['move'][0], HERO_SIZE)
+        self.__version = 0
+        self._image = Assets().transform(Assets().hero_animations['move'][0], HERO_SIZE)
 
     def update(self):
         self._frame += 1
@@ -281,17 +524,18 @@ class Hero(Entity):
                 self._current_animation = 'move'
                 self._image = Assets().hero_animations[self._current_animation][FC_HERO_MOVE*int(bool(self._inventory['equipment']['arm']))]
 
-    def render(self, screen):
+    def render(self, screen, alpha=1):
         image = self.image
         rect = image.get_rect()
+        x, y = self.screen_position(alpha)
         if self._current_animation == 'move':
-            rect.topleft = self.position.x % HORIZONTAL_TILES_COUNT * TILE_SIZE[0] + LEFT_SPACE, self.position.y % VERTICAL_TILES_COUNT * TILE_SIZE[1] + TOP_SPACE
+            rect.topleft = x, y
         elif self._current_animation == 'attack':
             if self.__side == RIGHT:
-                rect.topleft = self.position.x % HORIZONTAL_TILES_COUNT * TILE_SIZE[0] + LEFT_SPACE - 19, self.position.y % VERTICAL_TILES_COUNT * TILE_SIZE[1] + TOP_SPACE - 29
+                rect.topleft = x - 19, y - 29
             elif self.__side == LEFT:
-                rect.topleft = self.position.x % HORIZONTAL_TILES_COUNT * TILE_SIZE[0] + LEFT_SPACE - 75, self.position.y % VERTICAL_TILES_COUNT * TILE_SIZE[1] + TOP_SPACE - 29
-        screen.blit(pygame.transform.flip(image, self.__side, False), rect)
+                rect.topleft = x - 75, y - 29
+        return screen.blit(Assets().transform(image, flip_x=bool(self.__side)), rect)
 
     @Entity.health.setter
     def health(self, value):
@@ -299,19 +543,20 @@ class Hero(Entity):
             self._health = Hero.MAX_HEALTH
         else:
             self._health = value
+        self._changed()
+
+    def _changed(self):
+        self.__version += 1
 
     def move(self, key, room: Room):
         def can_stand(step_x=0, step_y=0):
-            if step_x != 0:
-                return room.tileOn(Position(int(self.position.x+step_x) % HORIZONTAL_TILES_COUNT, int(self.position.y) % VERTICAL_TILES_COUNT)).type != '#' and room.tileOn(Position(int(self.position.x+step_x) % HORIZONTAL_TILES_COUNT, int(self.position.y+1) % VERTICAL_TILES_COUNT)).type != '#' and (self.position.y % 1 == 0 or (room.tileOn(Position(int(self.position.x+step_x) % HORIZONTAL_TILES_COUNT, int(self.position.y+1) % VERTICAL_TILES_COUNT)).type != '#' and room.tileOn(Position(int(self.position.x+step_x) % HORIZONTAL_TILES_COUNT, int(self.position.y+2) % VERTICAL_TILES_COUNT)).type != '#'))
-            elif step_y != 0:
-                return room.tileOn(Position(int(self.position.x) % HORIZONTAL_TILES_COUNT, int(self.position.y+step_y) % VERTICAL_TILES_COUNT)).type != '#' and room.tileOn(Position(int(self.position.x+1) % HORIZONTAL_TILES_COUNT, int(self.position.y+step_y) % VERTICAL_TILES_COUNT)).type != '#' and (self.position.x % 1 == 0 or (room.tileOn(Position(int(self.position.x+1) % HORIZONTAL_TILES_COUNT, int(self.position.y+step_y) % VERTICAL_TILES_COUNT)).type != '#' and room.tileOn(Position(int(self.position.x+2) % HORIZONTAL_TILES_COUNT, int(self.position.y+step_y) % VERTICAL_TILES_COUNT)).type != '#'))
+            return room.can_move(self.position, HERO_SIZE_IN_TILES, step_x, step_y)
 
         self._image = Assets().hero_animations['move'][self.frame//7%FC_HERO_MOVE+FC_HERO_MOVE*int(bool(self._inventory['equipment']['arm']))]
         if key == pygame.K_DOWN:
             if self.position.y % VERTICAL_TILES_COUNT == VERTICAL_TILES_COUNT - HERO_SIZE_IN_TILES[1]:
                 self.position.y += HERO_SIZE_IN_TILES[1]
-            elif can_stand(step_y=HERO_SIZE_IN_TILES[1]):
+            elif can_stand(step_y=1/4):
                 self.position.y += 1/4
         elif key == pygame.K_UP:
             if self.position.y % VERTICAL_TILES_COUNT == 0:
@@ -327,11 +572,11 @@ class Hero(Entity):
         elif key == pygame.K_RIGHT:
             if self.position.x % HORIZONTAL_TILES_COUNT == HORIZONTAL_TILES_COUNT - HERO_SIZE_IN_TILES[0]:
                 self.position.x += HERO_SIZE_IN_TILES[0]
-            elif can_stand(step_x=HERO_SIZE_IN_TILES[0]):
+            elif can_stand(step_x=1/4):
                 self.position.x += 1/4
             self.__side = RIGHT
 
-    def attack(self, entity_lst):
+    def attack(self, room: Room):
         if self._inventory['equipment']['arm'] is not None:
             self._current_animation = 'attack'
             if self.__attack_count == 0:
@@ -342,14 +587,18 @@ class Hero(Entity):
             elif self.__attack_count == 12:
                 self.__attack_count = FC_HERO_ATTACK
         
+            if self.__side == RIGHT:
+                entity_lst = room.nearby('entities', self.position.x+64/TILE_SIZE[0], self.position.y-13, 31/TILE_SIZE[0], 13+45/TILE_SIZE[1])
+            else:
+                entity_lst = room.nearby('entities', self.position.x-61/TILE_SIZE[0], self.position.y-13, 29/TILE_SIZE[0], 13+45/TILE_SIZE[1])
             for entity in entity_lst:
                 if isinstance(entity, Monster):
                     if self.__side == RIGHT and self.position.x+64/TILE_SIZE[0] <= entity.position.x <= self.position.x+95/TILE_SIZE[0] and self.position.y-13 <= entity.position.y <= self.position.y+45/TILE_SIZE[1]:
-                        entity._health -= self._damage
+                        room.hit(entity, self._damage)
                         if not entity.isDead():
                             Sounds().hit.play()
                     elif self.__side == LEFT and self.position.x-61/TILE_SIZE[0] <= entity.position.x <= self.position.x-32/TILE_SIZE[0] and self.position.y-13 <= entity.position.y <= self.position.y+45/TILE_SIZE[1]:
-                        entity._health -= self._damage
+                        room.hit(entity, self._damage)
                         if not entity.isDead():
                             Sounds().hit.play()
 
@@ -358,12 +607,14 @@ class Hero(Entity):
 
     def take_item(self, item: Item, slot: int):
         self._inventory['items'][slot] = item
+        self._changed()
 
     def remove_item(self, slot: int):
         item = self._inventory['items'][slot]
         item.position.x = round(self.position.x+35/TILE_SIZE[0])
         item.position.y = round(self.position.y+39/TILE_SIZE[1])
         self._inventory['items'][slot] = None
+        self._changed()
 
     def dialogue(self):
         pass
@@ -381,15 +632,15 @@ class Hero(Entity):
         data.update({'health': self.health})
         data.update({'damage': self._damage})
         data.update({'armor': self._armor})
-        data.update({'position': self.position})
+        data.update({'position': self.position.copy()})
         data.update({'money': self._money})
-        inventory = deepcopy(self._inventory)
-        for invtype in inventory:
-            for slot in inventory[invtype]:
-                if inventory[invtype][slot] is not None:
-                    inventory[invtype][slot] = inventory[invtype][slot].save()
+        inventory = {}
+        for invtype in self._inventory:
+            inventory[invtype] = {}
+            for slot, item in self._inventory[invtype].items():
+                inventory[invtype][slot] = None if item is None else item.save()
         data.update({'inventory': inventory})
-        data.update({'effects': self._effects})
+        data.update({'effects': dict(self._effects)})
         data.update({'side': self.__side})
         return data
     
@@ -400,10 +651,7 @@ class Hero(Entity):
             for slot in inventory[invtype]:
                 objdata = inventory[invtype][slot]
                 if objdata is not None:
-                    if objdata['objtype'] == 'Item':
-                        inventory[invtype][slot] = Item.load(objdata)
-                    elif objdata['objtype'] == 'Armor':
-                        inventory[invtype][slot] = Armor.load(objdata)
+                    inventory[invtype][slot] = Room.load_object(objdata)
         return Hero( name=data['name'],
                      health=data['health'],
                      damage=data['damage'],
@@ -418,37 +666,45 @@ class Hero(Entity):
     def side(self):
         return self.__side
 
+    @property
+    def money(self):
+        return self._money
+
+    @money.setter
+    def money(self, value):
+        self._money = value
+        self._changed()
+
+    @property
+    def version(self):
+        return self.__version
+
     @property
     def image(self):
         return self._image
 
 
+@serializable(('name', 's'), ('position', 'P'), ('items', 'v'))
 class Bargainer(Entity):
-    def __init__(self, name='', pos=Position(0, 0), items=None):
+    __slots__ = ('_items',)
+
+    def __init__(self, name='', pos=None, items=None):
         super().__init__(name, pos=pos)
-        if items is None:
-            self._items = { 1: None,
-                            2: None,
-                            3: None,
-                            4: None,
-                            5: None,
-                            6: None,
-                            7: None,
-                            8: None,
-                            9: None }
-        else:
-            self._items = items
-        self._image = pygame.transform.scale2x(Assets().bargainer)
+        # levels only list the slots that hold something
+        self._items = {slot: None for slot in range(1, 10)}
+        if items is not None:
+            self._items.update(items)
+        self._image = Assets().transform(Assets().bargainer, scale2x=True)
     
     def sell(self, hero: Hero, slot: int):
-        if self._items[slot] is not None and hero._money >= self._items[slot].price and hero.empty_slot():
-            hero._money -= self._items[slot].price
+        if self._items[slot] is not None and hero.money >= self._items[slot].price and hero.empty_slot():
+            hero.money -= self._items[slot].price
             hero.take_item(self._items[slot], hero.empty_slot())
             self._items[slot] = None
 
     def buy(self, hero: Hero, item: Item):
         if self.empty_slot():
-            hero._money += item.price
+            hero.money += item.price
             self._items[self.empty_slot] = item
 
     def empty_slot(self):
@@ -461,19 +717,22 @@ class Bargainer(Entity):
         data = {}
         data.update({'objtype': 'Bargainer'})
         data.update({'name': self.name})
-        data.update({'position': self.position})
-        items = deepcopy(self._items)
-        for slot in items:
-            if items[slot] is not None:
-                items[slot] = items[slot].save()
+        data.update({'position': self.position.copy()})
+        items = {}
+        for slot, item in self._items.items():
+            items[slot] = None if item is None else item.save()
         data.update({'items': items})
         return data
     
     @staticmethod
     def load(data):
+        items = data['items']
+        for slot in items:
+            if items[slot] is not None:
+                items[slot] = Room.load_object(items[slot])
         return Bargainer( name=data['name'],
                           pos=data['position'],
-                          items=data['items'] )
+                          items=items )
     
     @property
     def image(self):
@@ -481,12 +740,16 @@ class Bargainer(Entity):
 
 
 class UsableItem(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def use(self, hero: Hero):
         pass
 
 
 class EquipableItem(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def equip(self, hero: Hero, active_slot):
         pass
@@ -497,6 +760,7 @@ class EquipableItem(ABC):
 
 
 class HealthPotion(Item, UsableItem):
+    __slots__ = ()
     __value = 20
     __cooldown = 20
 
@@ -505,6 +769,7 @@ class HealthPotion(Item, UsableItem):
 
 
 class InvisibilityPotion(Item, UsableItem):
+    __slots__ = ()
     __duration = 20
     __cooldown = 35
 
@@ -513,6 +778,7 @@ class InvisibilityPotion(Item, UsableItem):
 
 
 class StrengthPotion(Item, UsableItem):
+    __slots__ = ()
     __duration = 40
     __cooldown = 60
 
@@ -520,8 +786,11 @@ class StrengthPotion(Item, UsableItem):
         hero._effects['strength'] = StrengthPotion.__duration
 
 
+@serializable(('name', 's'), ('price', 'q'), ('position', 'P'), ('armor', 'q'), ('slot', 's'))
 class Armor(Item, EquipableItem):
-    def __init__(self, name='', price=0, pos=Position(0, 0), armor=0, slot=''):
+    __slots__ = ('__armor', '__slot')
+
+    def __init__(self, name='', price=0, pos=None, armor=0, slot=''):
         super().__init__(name, price, pos)
         self.__armor = armor
         self.__slot = slot
@@ -531,6 +800,7 @@ class Armor(Item, EquipableItem):
             hero._inventory['items'][active_slot] = None
             hero._inventory['equipment'][self.__slot] = self
             hero._armor += self.__armor
+            hero._changed()
         else:
             print("Slot is busy!")
     
@@ -540,6 +810,7 @@ class Armor(Item, EquipableItem):
             hero._inventory['equipment'][self.__slot] = None
             hero._inventory['items'][slot] = self
             hero._armor -= self.__armor
+            hero._changed()
         else:
             print("Slot is empty or inventory is full")
     
@@ -548,7 +819,7 @@ class Armor(Item, EquipableItem):
         data.update({'objtype': 'Armor'})
         data.update({'name': self.name})
         data.update({'price': self.price})
-        data.update({'position': self.position})
+        data.update({'position': self.position.copy()})
         data.update({'armor': self.armor})
         data.update({'slot': self.slot})
         return data
@@ -570,12 +841,17 @@ class Armor(Item, EquipableItem):
         return self.__slot
 
 
+@serializable(('is_active', '?'), ('frame', 'q'), ('color', 's'), ('destination', 'v'), ('position', 'P'))
 class Portal(RenderableObject, AnimatedObject, SavableObject):
-    def __init__(self, pos=Position(0, 0), size=(40, 75), is_active=True, frame=0, color='blue', destination={'position': Position(0, 0), 'level': ''}):
+    __slots__ = ('_current_animation', '_frame', 'is_active', '__color', '__destination', '_image')
+
+    def __init__(self, pos=None, size=(40, 75), is_active=True, frame=0, color='blue', destination=None):
         super(Portal, self).__init__(pos, size)
         super(RenderableObject, self).__init__()
         self.is_active = is_active
         self.__color = color
+        if destination is None:
+            destination = {'position': Position(0, 0), 'level': ''}
         self.__destination = destination
         self._image = Assets().portals[color][0]
     
@@ -590,8 +866,8 @@ class Portal(RenderableObject, AnimatedObject, SavableObject):
         data.update({'is_active': self.is_active})
         data.update({'frame': self.frame})
         data.update({'color': self.color})
-        data.update({'destination': self.destination})
-        data.update({'position': self.position})
+        data.update({'destination': {'position': self.destination['position'].copy(), 'level': self.destination['level']}})
+        data.update({'position': self.position.copy()})
 
         return data
     
@@ -617,8 +893,10 @@ class Portal(RenderableObject, AnimatedObject, SavableObject):
 
 
 class Monster(ABC):
+    __slots__ = ()
+
     @abstractmethod
-    def move(self, hero: Hero):
+    def move(self, hero: Hero, room: Room):
         pass
 
     @abstractmethod
@@ -626,13 +904,16 @@ class Monster(ABC):
         pass
 
 
+@serializable(('name', 's'), ('health', 'd'), ('damage', 'd'), ('armor', 'q'), ('position', 'P'), ('side', 'B'))
 class Pirate(Entity, Monster):
-    def __init__(self, name='Pirate', health=15, damage=0.5, armor=0, pos=Position(0, 0), size=(32, 50), side=RIGHT):
+    __slots__ = ('__side',)
+
+    def __init__(self, name='Pirate', health=15, damage=0.5, armor=0, pos=None, size=(32, 50), side=RIGHT):
         super(Pirate, self).__init__(name, health, damage, armor, pos, size=(32, 50))
         self.__side = side
-        self._image = pygame.transform.scale(Assets().entities[self.name]['move'][0], self.size)
+        self._image = Assets().transform(Assets().entities[self.name]['move'][0], self.size)
     
-    def update(self, hero: Hero):
+    def update(self, hero: Hero, room: Room):
         self._frame += 1
 
         if self._current_animation == 'attack':
@@ -644,37 +925,58 @@ class Pirate(Entity, Monster):
         elif self._current_animation == 'move':
             self._image = Assets().entities['Pirate']['move'][0]
 
-        if (hero.position.x <= self.position.x < hero.position.x+2 and hero.position.y-1 <= self.position.y <= hero.position.y+2) or (self.__side == RIGHT and hero.position.x-46/TILE_SIZE[0] <= self.position.x <= hero.position.x-32/TILE_SIZE[0] and hero.position.y-1/2 <= self.position.y <= hero.position.y+2+1/2) or (self.__side == LEFT and hero.position.x+64/TILE_SIZE[1] <= self.position.x <= hero.position.x+78/TILE_SIZE[1] and hero.position.y-1/2 <= self.position.y <= hero.position.y+2+1/2):
+        near = room.near_hero(self)
+        if near and ((hero.position.x <= self.position.x < hero.position.x+2 and hero.position.y-1 <= self.position.y <= hero.position.y+2) or (self.__side == RIGHT and hero.position.x-46/TILE_SIZE[0] <= self.position.x <= hero.position.x-32/TILE_SIZE[0] and hero.position.y-1/2 <= self.position.y <= hero.position.y+2+1/2) or (self.__side == LEFT and hero.position.x+64/TILE_SIZE[1] <= self.position.x <= hero.position.x+78/TILE_SIZE[1] and hero.position.y-1/2 <= self.position.y <= hero.position.y+2+1/2)):
             self.attack(hero)
-        elif self._current_animation == 'move':
-            self.move(hero)
+        elif near and self._current_animation == 'move':
+            self.move(hero, room)
         
-    def render(self, screen):
+    def render(self, screen, alpha=1):
         image = self.image
         rect = image.get_rect()
+        x, y = self.screen_position(alpha)
         if self.__side == RIGHT:
-            rect.topleft = self.position.x % HORIZONTAL_TILES_COUNT * TILE_SIZE[0] + LEFT_SPACE, self.position.y % VERTICAL_TILES_COUNT * TILE_SIZE[1] + TOP_SPACE
+            rect.topleft = x, y
         elif self.__side == LEFT:
-            rect.topleft = self.position.x % HORIZONTAL_TILES_COUNT * TILE_SIZE[0] + LEFT_SPACE - 18, self.position.y % VERTICAL_TILES_COUNT * TILE_SIZE[1] + TOP_SPACE
-        screen.blit(pygame.transform.flip(image, self.__side, False), rect)
+            rect.topleft = x - 18, y
+        return screen.blit(Assets().transform(image, flip_x=bool(self.__side)), rect)
+
+    def __move_to_hero(self, hero: Hero, room: Room):
+        field = room.flow_field(self.size_in_tiles, hero)
+        step_x, step_y = field.step(self.position.x % HORIZONTAL_TILES_COUNT, self.position.y % VERTICAL_TILES_COUNT)
+        if step_x != 0:
+            if room.can_move(self.position, self.size_in_tiles, step_x=step_x):
+                self.position.x += step_x
+            self.__side = LEFT if step_x < 0 else RIGHT
+        elif step_y != 0:
+            if room.can_move(self.position, self.size_in_tiles, step_y=step_y):
+                self.position.y += step_y
+        else:
+            self.__step_to_hero(hero, room)
 
-    def __move_to_hero(self, hero: Hero):
+    def __step_to_hero(self, hero: Hero, room: Room):
+        # straight line, once the flow field has nothing better to offer
         if self.frame % 2 == 0 or self.position.y == hero.position.y:
             if self.position.x >= hero.position.x:
-                self.position.x -= 1/16
+                if room.can_move(self.position, self.size_in_tiles, step_x=-1/16):
+                    self.position.x -= 1/16
                 self.__side = LEFT
             else:
-                self.position.x += 1/16
+                if room.can_move(self.position, self.size_in_tiles, step_x=1/16):
+                    self.position.x += 1/16
                 self.__side = RIGHT
         elif self.frame % 2 == 1 or self.position.x == hero.position.x:
             if self.position.y >= hero.position.y:
-                self.position.y -= 1/16
+                if room.can_move(self.position, self.size_in_tiles, step_y=-1/16):
+                    self.position.y -= 1/16
             else:
-                self.position.y += 1/16
+                if room.can_move(self.position, self.size_in_tiles, step_y=1/16):
+                    self.position.y += 1/16
 
-    def move(self, hero: Hero):  # add hero argument
-        if (self.position.x-hero.position.x)**2+(self.position.y-hero.position.y)**2 <= 9**2 and self.position.x // HORIZONTAL_TILES_COUNT == hero.position.x // HORIZONTAL_TILES_COUNT and self.position.y // VERTICAL_TILES_COUNT == hero.position.y // VERTICAL_TILES_COUNT:
-            self.__move_to_hero(hero)
+    def move(self, hero: Hero, room: Room):
+        if (self.position.x-hero.position.x)**2+(self.position.y-hero.position.y)**2 <= AGGRO_RADIUS**2 and self.position.x // HORIZONTAL_TILES_COUNT == hero.position.x // HORIZONTAL_TILES_COUNT and self.position.y // VERTICAL_TILES_COUNT == hero.position.y // VERTICAL_TILES_COUNT:
+            self.__move_to_hero(hero, room)
+            room.relocate(self)
             self._image = Assets().entities['Pirate']['move'][self.frame//5%2]
 
     def attack(self, hero: Hero):
@@ -692,7 +994,7 @@ class Pirate(Entity, Monster):
         data.update({'health': self.health})
         data.update({'damage': self._damage})
         data.update({'armor': self._armor})
-        data.update({'position': self.position})
+        data.update({'position': self.position.copy()})
         data.update({'side': self.__side})
         return data
 
@@ -0,0 +1,75 @@
+import numpy as np
+from math import ceil, floor
+from collections import deque
+
+
+STEP = 1/16
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class FlowField:
+    # breadth-first distances from the hero's tiles over one room; every cell stores the step to its parent,
+    # so any number of monsters can look up their next move in O(1)
+    def __init__(self, solid, size):
+        height, width = solid.shape
+        footprint_width, footprint_height = ceil(size[0]), ceil(size[1])
+        self.walkable = np.zeros(solid.shape, dtype=bool)
+        for y in range(height-footprint_height+1):
+            for x in range(width-footprint_width+1):
+                self.walkable[y, x] = not solid[y:y+footprint_height, x:x+footprint_width].any()
+        self.dx = np.zeros(solid.shape, dtype=np.int8)
+        self.dy = np.zeros(solid.shape, dtype=np.int8)
+        self.targets = None
+
+    def update(self, targets):
+        targets = tuple(targets)
+        if targets == self.targets:
+            return
+        self.targets = targets
+
+        height, width = self.walkable.shape
+        visited = np.zeros(self.walkable.shape, dtype=bool)
+        self.dx.fill(0)
+        self.dy.fill(0)
+        queue = deque()
+        for x, y in targets:
+            if self.walkable[y, x] and not visited[y, x]:
+                visited[y, x] = True
+                queue.append((x, y))
+
+        while queue:
+            x, y = queue.popleft()
+            for step_x, step_y in NEIGHBOURS:
+                next_x, next_y = x+step_x, y+step_y
+                if 0 <= next_x < width and 0 <= next_y < height and self.walkable[next_y, next_x] and not visited[next_y, next_x]:
+                    visited[next_y, next_x] = True
+                    self.dx[next_y, next_x] = -step_x
+                    self.dy[next_y, next_x] = -step_y
+                    queue.append((next_x, next_y))
+
+    def step(self, x, y):
+        # (0, 0) means the field has no advice: already at the hero or no path from here
+        height, width = self.walkable.shape
+        cell_x = min(max(floor(x+0.5), 0), width-1)
+        cell_y = min(max(floor(y+0.5), 0), height-1)
+        dx, dy = int(self.dx[cell_y, cell_x]), int(self.dy[cell_y, cell_x])
+        if dx != 0:
+            if y != cell_y:
+                return 0, STEP if cell_y > y else -STEP
+            return dx*STEP, 0
+        if dy != 0:
+            if x != cell_x:
+                return STEP if cell_x > x else -STEP, 0
+            return 0, dy*STEP
+        return 0, 0
+
+    def steps(self, x, y):
+        height, width = self.walkable.shape
+        cell_x = np.clip(np.floor(x+0.5).astype(int), 0, width-1)
+        cell_y = np.clip(np.floor(y+0.5).astype(int), 0, height-1)
+        dx, dy = self.dx[cell_y, cell_x], self.dy[cell_y, cell_x]
+        align_y = (dx != 0) & (y != cell_y)
+        align_x = (dx == 0) & (dy != 0) & (x != cell_x)
+        step_x = np.where(align_x, np.sign(cell_x-x)*STEP, np.where(align_y, 0, dx*STEP))
+        step_y = np.where(align_y, np.sign(cell_y-y)*STEP, np.where(align_x | (dx != 0), 0, dy*STEP))
+        return step_x, step_y
@@ -0,0 +1,134 @@
+import os
+import csv
+import pygame
+from time import perf_counter, strftime
+from collections import deque
+from Singleton import SingletonMeta
+from utils import Text
+from constants import *
+
+
+class Section:
+    def __init__(self, profiler, name):
+        self.__profiler = profiler
+        self.__name = name
+
+    def __enter__(self):
+        self.__start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.__profiler.add(self.__name, perf_counter()-self.__start)
+        return False
+
+
+class NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Profiler(metaclass=SingletonMeta):
+    PHASES = ('events', 'input', 'room.update', 'hero.update', 'background', 'room.render', 'interface.render', 'flip')
+
+    def __init__(self, window=PROFILER_WINDOW):
+        self.enabled = False
+        self.__null = NullSection()
+        self.__frames = deque(maxlen=window)
+        self.__phases = {phase: deque(maxlen=window) for phase in Profiler.PHASES}
+        self.__current = None
+        self.__frame_start = None
+        self.__rows = deque(maxlen=PROFILER_MAX_ROWS)
+        self.__frame_count = 0
+        self.__overlay = None
+        self.__overlay_age = 0
+        self.__exported = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.__current = None
+
+    def section(self, name):
+        if not self.enabled or self.__current is None:
+            return self.__null
+        return Section(self, name)
+
+    def add(self, name, seconds):
+        if self.__current is not None:
+            self.__current[name] = self.__current.get(name, 0) + seconds
+
+    def begin_frame(self):
+        if self.enabled:
+            self.__current = {}
+            self.__frame_start = perf_counter()
+
+    def end_frame(self):
+        if self.__current is None:
+            return
+        total = (perf_counter()-self.__frame_start)*1000
+        self.__frame_count += 1
+        self.__frames.append(total)
+        row = [self.__frame_count, round(total, 4)]
+        for phase in Profiler.PHASES:
+            value = self.__current.get(phase, 0)*1000
+            self.__phases[phase].append(value)
+            row.append(round(value, 4))
+        self.__rows.append(row)
+        self.__current = None
+
+    def percentile(self, value):
+        if not self.__frames:
+            return 0
+        frames = sorted(self.__frames)
+        return frames[min(len(frames)-1, int(len(frames)*value/100))]
+
+    def average(self, phase=None):
+        values = self.__frames if phase is None else self.__phases[phase]
+        return sum(values)/len(values) if values else 0
+
+    def export(self, filename=None):
+        if filename is None:
+            os.makedirs('OOP_game/profiles', exist_ok=True)
+            filename = strftime('OOP_game/profiles/frames-%Y%m%d-%H%M%S.csv')
+        with open(filename, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(['frame', 'total_ms'] + [phase+'_ms' for phase in Profiler.PHASES])
+            writer.writerows(self.__rows)
+        # the overlay names the last export until the next one
+        self.__exported = filename
+        self.__overlay = None
+        return filename
+
+    def render(self, screen):
+        if not self.enabled:
+            return None
+        # the overlay is rebuilt a few times a second, not every frame, so it barely shows up in its own numbers
+        if self.__overlay is None or self.__overlay_age >= PROFILER_REFRESH:
+            self.__overlay = self.__compose()
+            self.__overlay_age = 0
+        self.__overlay_age += 1
+        return screen.blit(self.__overlay, (WIDTH-PROFILER_SIZE[0]-5, 5))
+
+    def __compose(self):
+        overlay = pygame.Surface(PROFILER_SIZE, pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+
+        lines = [ f'frame {self.average():6.2f} ms  p95 {self.percentile(95):6.2f}  p99 {self.percentile(99):6.2f}' ]
+        lines += [ f'{phase:17} {self.average(phase):6.2f} ms' for phase in Profiler.PHASES ]
+        if self.__exported is not None:
+            lines.append(f'saved {os.path.basename(self.__exported)}')
+        for i in range(len(lines)):
+            overlay.blit(Text().render(lines[i], *PROFILER_FONT, WHITE), (5, 3+12*i))
+
+        graph = pygame.Rect(5, PROFILER_SIZE[1]-45, PROFILER_SIZE[0]-10, 40)
+        # the graph spans two frame budgets; the line marks one budget
+        budget = 1000/60
+        scale = graph.height/(2*budget)
+        pygame.draw.line(overlay, (200, 60, 60), (graph.left, graph.bottom-budget*scale), (graph.right, graph.bottom-budget*scale))
+        frames = list(self.__frames)[-graph.width:]
+        if len(frames) > 1:
+            points = [ (graph.left+i, graph.bottom-min(frames[i], 2*budget)*scale) for i in range(len(frames)) ]
+            pygame.draw.lines(overlay, (90, 220, 90), False, points)
+        return overlay
@@ -0,0 +1,33 @@
+import threading
+from queue import Queue
+
+
+class SaveWorker:
+    # writes saves on a background thread, so the game thread only pays for taking the snapshot
+    def __init__(self, write):
+        self.__write = write
+        self.__jobs = Queue()
+        self.__thread = None
+
+    def submit(self, save, callback):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name='save worker', daemon=True)
+            self.__thread.start()
+        self.__jobs.put((save, callback))
+
+    def __run(self):
+        while True:
+            save, callback = self.__jobs.get()
+            try:
+                callback(self.__write(save))
+            except Exception as error:
+                print(f'Unable to save {save.savename}: {error}')
+            finally:
+                self.__jobs.task_done()
+
+    def wait(self):
+        self.__jobs.join()
+
+    @property
+    def busy(self):
+        return self.__jobs.unfinished_tasks > 0
@@ -0,0 +1,47 @@
+from time import perf_counter
+from collections import deque
+from constants import BACKGROUND_INTERVAL, BACKGROUND_BUDGET, MAX_CATCH_UP
+
+
+class BackgroundScheduler:
+    # loaded rooms the hero is not in are owed one update every `interval` ticks; owed updates are paid round-robin
+    # until `budget` seconds of the tick are spent, and whatever a room still owes is run at once when the hero walks in
+    def __init__(self, interval=BACKGROUND_INTERVAL, budget=BACKGROUND_BUDGET, catch_up=MAX_CATCH_UP):
+        self.__interval = interval
+        self.__budget = budget
+        self.__catch_up = catch_up
+        self.__ticks = 0
+        self.__owed = {}
+        self.__queue = deque()
+
+    def tick(self, rooms, visible, hero):
+        self.__ticks += 1
+        if self.__ticks % self.__interval == 0:
+            rooms = [room for room in rooms if room is not visible]
+            # unloaded rooms drop out here; their stale queue entries are skipped below
+            self.__owed = {room: self.__owed[room] for room in rooms if room in self.__owed}
+            for room in rooms:
+                owed = self.__owed.get(room, 0)
+                if owed == 0:
+                    self.__queue.append(room)
+                self.__owed[room] = min(owed+1, self.__catch_up)
+
+        start = perf_counter()
+        while self.__queue and perf_counter()-start < self.__budget:
+            room = self.__queue.popleft()
+            owed = self.__owed.get(room, 0)
+            if owed == 0 or room is visible:
+                continue
+            room.update(hero, visible=False)
+            if owed > 1:
+                self.__owed[room] = owed-1
+                self.__queue.append(room)
+            else:
+                del self.__owed[room]
+
+    def enter(self, room, hero):
+        for _ in range(self.__owed.pop(room, 0)):
+            room.update(hero, visible=False)
+
+    def owed(self, room):
+        return self.__owed.get(room, 0)
@@ -0,0 +1,240 @@
+import struct
+import numbers
+
+
+# layout: MAGIC, version, the interned strings, the record schemas used in the file, then the encoded value.
+# Schemas travel with the file, so saves written before a class gained or lost fields still decode;
+# migrations turn whatever an older version decoded into what the current one expects
+MAGIC = b'OOPB'
+VERSION = 1
+HEAD = struct.Struct('<4sH')
+COUNT = struct.Struct('<I')
+
+NONE, FALSE, TRUE, INT, FLOAT, STRING, LIST, TUPLE, DICT, VALUE, RECORD = range(11)
+NUMBERS = {INT: struct.Struct('<q'), FLOAT: struct.Struct('<d')}
+
+# record field codes: fixed-size fields are packed into one struct per record, the rest follow self-described.
+# 's' is an interned string and 'P' a Position; any other code is a self-described value
+FIELDS = {'s': 'I', 'P': 'dd', 'q': 'q', 'd': 'd', 'B': 'B', '?': '?'}
+POSITION = 'Position'
+
+_records = {}
+_values = {}
+_migrations = {}
+
+
+def serializable(*fields):
+    # class decorator: instances save() to a dict with 'objtype' set to the class name and `fields` besides
+    def decorator(cls):
+        _records[cls.__name__] = (cls.load, fields)
+        return cls
+    return decorator
+
+
+def value_type(cls, format, pack, unpack):
+    _values[cls] = (cls.__name__, struct.Struct('<'+format), pack)
+    _values[cls.__name__] = (struct.Struct('<'+format), unpack)
+
+
+def migration(version):
+    # registers a function that upgrades data decoded from a version `version` file to version+1
+    def decorator(function):
+        _migrations[version] = function
+        return function
+    return decorator
+
+
+def restore(data):
+    loader = _records.get(data.get('objtype'))
+    return None if loader is None else loader[0](data)
+
+
+class Writer:
+    def __init__(self):
+        self.__body = bytearray()
+        self.__strings = {}
+        self.__schemas = {}
+
+    def string(self, string):
+        index = self.__strings.get(string)
+        if index is None:
+            index = self.__strings[string] = len(self.__strings)
+        return index
+
+    def value(self, value):
+        body = self.__body
+        if value is None or value is False or value is True:
+            body.append(NONE if value is None else TRUE if value else FALSE)
+        elif isinstance(value, numbers.Integral):
+            body.append(INT)
+            body += NUMBERS[INT].pack(int(value))
+        elif isinstance(value, numbers.Real):
+            body.append(FLOAT)
+            body += NUMBERS[FLOAT].pack(float(value))
+        elif isinstance(value, str):
+            body.append(STRING)
+            body += COUNT.pack(self.string(value))
+        elif isinstance(value, (list, tuple)):
+            body.append(LIST if isinstance(value, list) else TUPLE)
+            body += COUNT.pack(len(value))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, dict):
+            if not self.__record(value):
+                body.append(DICT)
+                body += COUNT.pack(len(value))
+                for key, item in value.items():
+                    self.value(key)
+                    self.value(item)
+        elif type(value) in _values:
+            name, layout, pack = _values[type(value)]
+            body.append(VALUE)
+            body += COUNT.pack(self.string(name))
+            body += layout.pack(*pack(value))
+        else:
+            raise TypeError(f'Unable to serialize {type(value).__name__}')
+
+    def __record(self, data):
+        objtype = data.get('objtype')
+        if objtype not in _records:
+            return False
+        fields = _records[objtype][1]
+        if len(data) != len(fields)+1 or any(name not in data for name, _ in fields):
+            return False
+        if objtype not in self.__schemas:
+            self.__schemas[objtype] = (len(self.__schemas), fields, Writer.layout(fields))
+        number, fields, layout = self.__schemas[objtype]
+
+        packed = []
+        for name, code in fields:
+            if code == 's':
+                packed.append(self.string(data[name]))
+            elif code == 'P':
+                packed += (data[name].x, data[name].y)
+            elif code in FIELDS:
+                packed.append(data[name])
+        self.__body.append(RECORD)
+        self.__body += COUNT.pack(number)
+        self.__body += layout.pack(*packed)
+        for name, code in fields:
+            if code not in FIELDS:
+                self.value(data[name])
+        return True
+
+    @staticmethod
+    def layout(fields):
+        return struct.Struct('<'+''.join(FIELDS[code] for _, code in fields if code in FIELDS))
+
+    def bytes(self):
+        # the schema names and field names go into the string table too, so it has to be written last
+        schemas = bytearray(COUNT.pack(len(self.__schemas)))
+        for objtype, (number, fields, layout) in sorted(self.__schemas.items(), key=lambda item: item[1][0]):
+            schemas += COUNT.pack(self.string(objtype)) + COUNT.pack(len(fields))
+            for name, code in fields:
+                schemas += COUNT.pack(self.string(name)) + code.encode()
+
+        strings = bytearray(COUNT.pack(len(self.__strings)))
+        for string in self.__strings:
+            encoded = string.encode()
+            strings += COUNT.pack(len(encoded)) + encoded
+        return HEAD.pack(MAGIC, VERSION) + strings + schemas + self.__body
+
+
+class Reader:
+    def __init__(self, data):
+        self.__data = memoryview(data)
+        magic, self.version = HEAD.unpack_from(self.__data)
+        if magic != MAGIC:
+            raise ValueError('Not a serialized save')
+        if self.version > VERSION:
+            raise ValueError(f'Save format {self.version} is newer than this game supports ({VERSION})')
+        self.__offset = HEAD.size
+
+        self.__strings = []
+        for _ in range(self.__count()):
+            length = self.__count()
+            self.__strings.append(str(self.__data[self.__offset:self.__offset+length], 'utf-8'))
+            self.__offset += length
+
+        self.__schemas = []
+        for _ in range(self.__count()):
+            objtype = self.__strings[self.__count()]
+            fields = []
+            for _ in range(self.__count()):
+                name = self.__strings[self.__count()]
+                fields.append((name, chr(self.__data[self.__offset])))
+                self.__offset += 1
+            self.__schemas.append((objtype, fields, Writer.layout(fields)))
+
+    def __count(self):
+        count, = COUNT.unpack_from(self.__data, self.__offset)
+        self.__offset += COUNT.size
+        return count
+
+    def value(self):
+        tag = self.__data[self.__offset]
+        self.__offset += 1
+        if tag == NONE:
+            return None
+        elif tag == FALSE or tag == TRUE:
+            return tag == TRUE
+        elif tag in NUMBERS:
+            value, = NUMBERS[tag].unpack_from(self.__data, self.__offset)
+            self.__offset += NUMBERS[tag].size
+            return value
+        elif tag == STRING:
+            return self.__strings[self.__count()]
+        elif tag == LIST or tag == TUPLE:
+            items = [self.value() for _ in range(self.__count())]
+            return items if tag == LIST else tuple(items)
+        elif tag == DICT:
+            result = {}
+            for _ in range(self.__count()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        elif tag == VALUE:
+            layout, unpack = _values[self.__strings[self.__count()]]
+            fields = layout.unpack_from(self.__data, self.__offset)
+            self.__offset += layout.size
+            return unpack(*fields)
+        elif tag == RECORD:
+            return self.__record()
+        raise ValueError(f'Corrupted save: unknown tag {tag}')
+
+    def __record(self):
+        objtype, fields, layout = self.__schemas[self.__count()]
+        packed = iter(layout.unpack_from(self.__data, self.__offset))
+        self.__offset += layout.size
+
+        data = {'objtype': objtype}
+        for name, code in fields:
+            if code == 's':
+                data[name] = self.__strings[next(packed)]
+            elif code == 'P':
+                x, y = next(packed), next(packed)
+                data[name] = _values[POSITION][1](x, y)
+            elif code in FIELDS:
+                data[name] = next(packed)
+        for name, code in fields:
+            if code not in FIELDS:
+                data[name] = self.value()
+        return data
+
+
+def dumps(value):
+    writer = Writer()
+    writer.value(value)
+    return writer.bytes()
+
+
+def loads(data):
+    reader = Reader(data)
+    value = reader.value()
+    for version in range(reader.version, VERSION):
+        value = _migrations[version](value)
+    return value
+
+
+def is_serialized(data):
+    return data[:len(MAGIC)] == MAGIC
@@ -1,18 +1,154 @@
+import os
+import hashlib
 import pygame
 from Singleton import SingletonMeta
+from utils import write_atomically
+from constants import SOUND_BUILD, SOUND_VOICES
+
+
+VERSION = 1
+
+
+class SilentSound:
+    def play(self, *args, **kwargs):
+        return None
+
+    def stop(self):
+        pass
+
+    def set_volume(self, value):
+        pass
+
+
+class SoundCache:
+    # decoded samples are stored under the hash of the source file and the mixer format,
+    # so an MP3 is decoded once and read back as raw samples on later runs
+    def __init__(self, build=SOUND_BUILD):
+        self.__build = build
+
+    def load(self, filename):
+        try:
+            with open(filename, 'rb') as source:
+                digest = hashlib.sha256(source.read())
+        except OSError:
+            raise SystemExit(f'Unable to open file {filename}')
+        digest.update(repr((VERSION, pygame.mixer.get_init())).encode())
+        path = os.path.join(self.__build, digest.hexdigest())
+
+        if os.path.exists(path):
+            with open(path, 'rb') as samples:
+                return pygame.mixer.Sound(buffer=samples.read())
+
+        sound = pygame.mixer.Sound(filename)
+        os.makedirs(self.__build, exist_ok=True)
+        write_atomically(path, sound.get_raw())
+        return sound
+
+
+class VoicePool:
+    # every effect plays on a fixed set of mixer channels. An effect already on as many voices as it may use
+    # restarts its oldest one; when every channel is busy the oldest voice of the least important effect
+    # is taken over, unless everything playing matters more than the new sound, which is then dropped
+    def __init__(self, voices=SOUND_VOICES):
+        self.__count = voices
+        self.__channels = None
+        self.__voices = [None]*voices
+        self.__plays = 0
+
+    def __ready(self):
+        # the mixer has to be initialized before channels can be reserved
+        if self.__channels is None:
+            pygame.mixer.set_num_channels(self.__count)
+            self.__channels = [pygame.mixer.Channel(index) for index in range(self.__count)]
+        return self.__channels
+
+    def play(self, effect, sound, loops=0, maxtime=0, fade_ms=0):
+        channels = self.__ready()
+        free = victim = None
+        owned = []
+        for index, channel in enumerate(channels):
+            voice = self.__voices[index]
+            if voice is None or not channel.get_busy():
+                if free is None:
+                    free = index
+                continue
+            if voice[0] is effect:
+                owned.append(index)
+            if victim is None or (voice[0].priority, voice[1]) < (self.__voices[victim][0].priority, self.__voices[victim][1]):
+                victim = index
+
+        if len(owned) >= effect.voices:
+            index = min(owned, key=lambda index: self.__voices[index][1])
+        elif free is not None:
+            index = free
+        elif self.__voices[victim][0].priority <= effect.priority:
+            index = victim
+        else:
+            return None
+
+        self.__plays += 1
+        self.__voices[index] = (effect, self.__plays)
+        channels[index].play(sound, loops, maxtime, fade_ms)
+        return channels[index]
+
+    def stop(self, effect):
+        for index, voice in enumerate(self.__voices):
+            if voice is not None and voice[0] is effect:
+                self.__channels[index].stop()
+                self.__voices[index] = None
+
+
+class SoundEffect:
+    # the samples are only loaded the first time the effect is played
+    def __init__(self, filename, cache, pool, volume=None, voices=1, priority=0):
+        self.__filename = filename
+        self.__cache = cache
+        self.__pool = pool
+        self.__volume = volume
+        self.__sound = None
+        self.voices = voices
+        self.priority = priority
+
+    @property
+    def sound(self):
+        if self.__sound is None:
+            self.__sound = self.__cache.load(self.__filename)
+            if self.__volume is not None:
+                self.__sound.set_volume(self.__volume)
+        return self.__sound
+
+    def play(self, loops=0, maxtime=0, fade_ms=0):
+        return self.__pool.play(self, self.sound, loops, maxtime, fade_ms)
+
+    def stop(self):
+        self.__pool.stop(self)
+
+    def set_volume(self, value):
+        self.__volume = value
+        if self.__sound is not None:
+            self.__sound.set_volume(value)
 
 
 class Sounds(metaclass=SingletonMeta):
-    def __init__(self):
-        self.menu_selection = pygame.mixer.Sound('OOP_game/sounds/menu selection.mp3')
-        self.menu_selection.set_volume(0.85)
-        self.select = pygame.mixer.Sound('OOP_game/sounds/select2.mp3')
-        self.select.set_volume(0.35)
-        # self.footstep = pygame.mixer.Sound('OOP_game/sounds/footstep.wav')
-        self.sword_swing = pygame.mixer.Sound('OOP_game/sounds/sword.mp3')
-        self.sword_swing.set_volume(0.40)
-        self.teleportation = pygame.mixer.Sound('OOP_game/sounds/teleport1.mp3')
-        self.teleportation.set_volume(0.20)
-        self.hit = pygame.mixer.Sound('OOP_game/sounds/hit.wav')
-        self.death = pygame.mixer.Sound('OOP_game/sounds/death.mp3')
-        self.death.set_volume(0.49)
+    # voices is how many copies of an effect may overlap, priority decides which effects give way when the pool is full
+    def __init__(self, muted=False):
+        self.muted = muted
+        self.__cache = SoundCache()
+        self.pool = VoicePool()
+        self.menu_selection = self.__load('OOP_game/sounds/menu selection.mp3', 0.85, voices=1, priority=3)
+        self.select = self.__load('OOP_game/sounds/select2.mp3', 0.35, voices=1, priority=3)
+        # self.footstep = self.__load('OOP_game/sounds/footstep.wav')
+        self.sword_swing = self.__load('OOP_game/sounds/sword.mp3', 0.40, voices=2, priority=1)
+        self.teleportation = self.__load('OOP_game/sounds/teleport1.mp3', 0.20, voices=1, priority=2)
+        self.hit = self.__load('OOP_game/sounds/hit.wav', voices=3, priority=0)
+        self.death = self.__load('OOP_game/sounds/death.mp3', 0.49, voices=1, priority=3)
+
+    def mute(self):
+        self.muted = True
+        for name in ('menu_selection', 'select', 'sword_swing', 'teleportation', 'hit', 'death'):
+            setattr(self, name, SilentSound())
+
+    def __load(self, filename, volume=None, voices=1, priority=0):
+        if self.muted:
+            return SilentSound()
+        return SoundEffect(filename, self.__cache, self.pool, volume, voices, priority)
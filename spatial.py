@@ -0,0 +1,64 @@
+from math import floor
+from constants import SPATIAL_CELL_SIZE
+
+
+class SpatialHash:
+    # uniform grid over tile coordinates; every object is filed under all cells its box touches
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.__cell_size = cell_size
+        self.__cells = {}
+        self.__keys = {}
+
+    def __keys_for(self, x, y, width, height):
+        size = self.__cell_size
+        return tuple( (cx, cy) for cx in range(floor(x/size), floor((x+width)/size)+1)
+                               for cy in range(floor(y/size), floor((y+height)/size)+1) )
+
+    def __object_keys(self, obj):
+        width, height = obj.size_in_tiles
+        return self.__keys_for(obj.position.x, obj.position.y, width, height)
+
+    def insert(self, obj):
+        keys = self.__object_keys(obj)
+        self.__keys[obj] = keys
+        for key in keys:
+            self.__cells.setdefault(key, {})[obj] = None
+
+    def remove(self, obj):
+        for key in self.__keys.pop(obj, ()):
+            cell = self.__cells[key]
+            del cell[obj]
+            if not cell:
+                del self.__cells[key]
+
+    def update(self, obj):
+        keys = self.__object_keys(obj)
+        if self.__keys.get(obj) != keys:
+            self.remove(obj)
+            self.__keys[obj] = keys
+            for key in keys:
+                self.__cells.setdefault(key, {})[obj] = None
+
+    def query(self, x, y, width, height):
+        found = {}
+        for key in self.__keys_for(x, y, width, height):
+            cell = self.__cells.get(key)
+            if cell is not None:
+                found.update(cell)
+
+        result = []
+        for obj in found:
+            obj_width, obj_height = obj.size_in_tiles
+            if obj.position.x <= x+width and x <= obj.position.x+obj_width and obj.position.y <= y+height and y <= obj.position.y+obj_height:
+                result.append(obj)
+        return result
+
+    def query_radius(self, x, y, radius):
+        return [ obj for obj in self.query(x-radius, y-radius, 2*radius, 2*radius)
+                 if (obj.position.x-x)**2 + (obj.position.y-y)**2 <= radius**2 ]
+
+    def __contains__(self, obj):
+        return obj in self.__keys
+
+    def __len__(self):
+        return len(self.__keys)
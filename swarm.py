@@ -0,0 +1,113 @@
+import numpy as np
+from utils import Assets
+from constants import *
+
+
+MOVE = 0
+ATTACK = 1
+
+
+class PirateSwarm:
+    # steps every pirate of a room in one vectorised pass; the Pirate objects only receive the results for rendering
+    def __init__(self, pirates):
+        self.__pirates = list(pirates)
+        self.__slots = {pirate: i for i, pirate in enumerate(self.__pirates)}
+        self.x = np.array([pirate.position.x for pirate in self.__pirates], dtype=float)
+        self.y = np.array([pirate.position.y for pirate in self.__pirates], dtype=float)
+        self.width = np.array([pirate.size_in_tiles[0] for pirate in self.__pirates], dtype=float)
+        self.height = np.array([pirate.size_in_tiles[1] for pirate in self.__pirates], dtype=float)
+        self.health = np.array([pirate.health for pirate in self.__pirates], dtype=float)
+        self.damage = np.array([pirate._damage for pirate in self.__pirates], dtype=float)
+        self.frame = np.array([pirate.frame for pirate in self.__pirates], dtype=int)
+        self.side = np.array([pirate.side for pirate in self.__pirates], dtype=int)
+        self.animation = np.array([ATTACK if pirate._current_animation == 'attack' else MOVE for pirate in self.__pirates], dtype=int)
+
+    def __contains__(self, pirate):
+        return pirate in self.__slots
+
+    def __len__(self):
+        return len(self.__pirates)
+
+    def hit(self, pirate, damage):
+        self.health[self.__slots[pirate]] -= damage
+
+    def dead(self):
+        return [self.__pirates[i] for i in np.flatnonzero(self.health <= 0)]
+
+    def update(self, hero, room, visible=True):
+        hx, hy = hero.position.x, hero.position.y
+        x, y, frame, side, animation = self.x, self.y, self.frame, self.side, self.animation
+        previous_x, previous_y = x.copy(), y.copy()
+
+        frame += 1
+        attacking = animation == ATTACK
+        image_attack = attacking.copy()
+        image_index = np.where(attacking, frame//5 % 7, 0)
+        finished = attacking & (frame == 5*7)
+        frame[finished] = 0
+        animation[finished] = MOVE
+
+        near = visible & (x <= hx+AGGRO_RADIUS) & (hx-AGGRO_RADIUS <= x+self.width) & (y <= hy+AGGRO_RADIUS) & (hy-AGGRO_RADIUS <= y+self.height)
+        in_range = ( ((hx <= x) & (x < hx+2) & (hy-1 <= y) & (y <= hy+2))
+                   | ((side == RIGHT) & (hx-46/TILE_SIZE[0] <= x) & (x <= hx-32/TILE_SIZE[0]) & (hy-1/2 <= y) & (y <= hy+2+1/2))
+                   | ((side == LEFT) & (hx+64/TILE_SIZE[1] <= x) & (x <= hx+78/TILE_SIZE[1]) & (hy-1/2 <= y) & (y <= hy+2+1/2)) )
+
+        attack = near & in_range
+        starting = attack & (animation != ATTACK)
+        animation[starting] = ATTACK
+        frame[starting] = 0
+        hits = attack & (frame == 24)
+        if hits.any():
+            hero.health -= float(self.damage[hits].sum())
+
+        chase = ( near & ~in_range & (animation == MOVE)
+                & ((x-hx)**2 + (y-hy)**2 <= AGGRO_RADIUS**2)
+                & (x // HORIZONTAL_TILES_COUNT == hx // HORIZONTAL_TILES_COUNT)
+                & (y // VERTICAL_TILES_COUNT == hy // VERTICAL_TILES_COUNT) )
+        # follow the room's flow field; pirates it has no step for go straight at the hero
+        if chase.any():
+            field = room.flow_field((self.width[0], self.height[0]), hero)
+            step_x, step_y = field.steps(x % HORIZONTAL_TILES_COUNT, y % VERTICAL_TILES_COUNT)
+        else:
+            step_x = step_y = np.zeros(len(x))
+        straight = chase & (step_x == 0) & (step_y == 0)
+        horizontal = straight & ((frame % 2 == 0) | (y == hy))
+        vertical = straight & ~horizontal
+        left = (horizontal & (x >= hx)) | (chase & (step_x < 0))
+        right = (horizontal & (x < hx)) | (chase & (step_x > 0))
+        up = (vertical & (y >= hy)) | (chase & (step_y < 0))
+        down = (vertical & (y < hy)) | (chase & (step_y > 0))
+        side[left] = LEFT
+        side[right] = RIGHT
+
+        step = 1/16
+        left &= ~room.collides_many(x-step, y, np.full_like(x, step), self.height)
+        right &= ~room.collides_many(x+self.width, y, np.full_like(x, step), self.height)
+        up &= ~room.collides_many(x, y-step, self.width, np.full_like(y, step))
+        down &= ~room.collides_many(x, y+self.height, self.width, np.full_like(y, step))
+        x[left] -= step
+        x[right] += step
+        y[up] -= step
+        y[down] += step
+
+        image_attack[chase] = False
+        image_index[chase] = frame[chase]//5 % 2
+
+        self.__write_back(previous_x, previous_y, image_attack, image_index, np.flatnonzero(chase), room)
+
+    def __write_back(self, previous_x, previous_y, image_attack, image_index, moved, room):
+        frames = Assets().entities['Pirate']
+        x, y = self.x.tolist(), self.y.tolist()
+        frame, side, animation = self.frame.tolist(), self.side.tolist(), self.animation.tolist()
+        image_attack, image_index = image_attack.tolist(), image_index.tolist()
+        previous_x, previous_y = previous_x.tolist(), previous_y.tolist()
+        for i, pirate in enumerate(self.__pirates):
+            pirate._previous_position = (previous_x[i], previous_y[i])
+            pirate.position.x = x[i]
+            pirate.position.y = y[i]
+            pirate._frame = frame[i]
+            pirate.side = side[i]
+            pirate._current_animation = 'attack' if animation[i] == ATTACK else 'move'
+            pirate._image = frames['attack' if image_attack[i] else 'move'][image_index[i]]
+        for i in moved.tolist():
+            room.relocate(self.__pirates[i])
@@ -1,82 +1,178 @@
+import os
+import shutil
+import threading
 import pygame
 from constants import *
 from Singleton import SingletonMeta
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Mapping
+from atlas import AtlasBuilder, Atlas
 
 
-class Spritesheet:
-    def __init__(self, filename):
-        try:
-            self.__sheet = pygame.image.load(filename).convert_alpha()
-        except:
-            raise SystemExit(f'Unable to open file {filename}')
-    
-    def get_image(self, area):
-        rect = pygame.Rect(area)
-        image = pygame.Surface(rect.size, pygame.SRCALPHA)
-        image.blit(self.__sheet, (0, 0), rect)
-        
-        return image
+def write_atomically(path, content):
+    # `content` is the bytes of a file, or a function that builds the file or directory at the path it is given.
+    # It is written next to `path` and renamed into place, so an interrupted write is never picked up
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if callable(content):
+        content(temporary)
+    else:
+        with open(temporary, 'wb') as file:
+            file.write(content)
+    try:
+        os.replace(temporary, path)
+    except OSError:
+        if not os.path.isdir(temporary):
+            raise
+        # another process finished the same build first
+        shutil.rmtree(temporary)
+
+
+class TransformCache:
+    # surfaces handed out here are shared between callers and must not be drawn on
+    def __init__(self, maxsize=TRANSFORM_CACHE_SIZE):
+        self.__maxsize = maxsize
+        self.__surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image, size=None, scale2x=False, flip_x=False, flip_y=False, angle=0):
+        if size is None and not scale2x and not flip_x and not flip_y and angle == 0:
+            return image
+
+        key = (image, size, scale2x, flip_x, flip_y, angle)
+        surface = self.__surfaces.get(key)
+        if surface is not None:
+            self.__surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = image
+        if scale2x:
+            surface = pygame.transform.scale2x(surface)
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        if angle != 0:
+            surface = pygame.transform.rotate(surface, angle)
+        if flip_x or flip_y:
+            surface = pygame.transform.flip(surface, flip_x, flip_y)
+
+        self.__surfaces[key] = surface
+        if len(self.__surfaces) > self.__maxsize:
+            self.__surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.__surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__surfaces)
+
+
+class Text(metaclass=SingletonMeta):
+    # fonts are resolved once per (name, size); rendered strings are shared and must not be drawn on
+    def __init__(self, maxsize=TEXT_CACHE_SIZE):
+        self.__maxsize = maxsize
+        self.__fonts = {}
+        self.__surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, name, size):
+        font = self.__fonts.get((name, size))
+        if font is None:
+            font = pygame.font.SysFont(name, size)
+            self.__fonts[(name, size)] = font
+        return font
+
+    def render(self, string, name, size, color=WHITE, antialias=False):
+        key = (string, name, size, color, antialias)
+        surface = self.__surfaces.get(key)
+        if surface is not None:
+            self.__surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.font(name, size).render(string, antialias, color)
+        self.__surfaces[key] = surface
+        if len(self.__surfaces) > self.__maxsize:
+            self.__surfaces.popitem(last=False)
+        return surface
+
+
+class LazyFrames(Mapping):
+    # the frames under a key are only loaded the first time the key is looked up
+    def __init__(self, loaders):
+        self.__loaders = loaders
+        self.__frames = {}
+
+    def __getitem__(self, key):
+        frames = self.__frames.get(key)
+        if frames is None:
+            frames = self.__frames[key] = self.__loaders[key]()
+        return frames
+
+    def __iter__(self):
+        return iter(self.__loaders)
+
+    def __len__(self):
+        return len(self.__loaders)
 
 
 class Assets(metaclass=SingletonMeta):
+    # frames are views into the atlases packed by AtlasBuilder; the groups the first room does not need
+    # are loaded the first time one of their frames is used
     def __init__(self):
-        self.spritesheets = {
-            'tmp':       Spritesheet('OOP_game/assets/hero.png'),
-            'hero1':     Spritesheet('OOP_game/assets/move.png'),
-            'hero2':     Spritesheet('OOP_game/assets/attack.png'),
-            'inventory': Spritesheet('OOP_game/assets/inventory1.png'),
-            'slot':      Spritesheet('OOP_game/assets/activeslot.png'),
-            'health':    Spritesheet('OOP_game/assets/health.png'),
-            'armor':     Spritesheet('OOP_game/assets/armor.png'),
-            'coin':      Spritesheet('OOP_game/assets/coin.png'),
-            'pause':     Spritesheet('OOP_game/assets/pause.png'),
-            'shop':      Spritesheet('OOP_game/assets/shop.png'),
-            'savename':  Spritesheet('OOP_game/assets/savename.png'),
-            'portals':   Spritesheet('OOP_game/assets/portals.png'),
-            'pirate1':    Spritesheet('OOP_game/assets/pirate move.png'),
-            'pirate2':    Spritesheet('OOP_game/assets/pirate attack.png')
-        }
-
-        self.tiles = {
-            '#': self.spritesheets['tmp'].get_image(( 0*16,  1*16, 16, 16)),
-            '_': self.spritesheets['tmp'].get_image(( 1*16,  0*16, 16, 16)),
-            ']': pygame.transform.rotate(self.spritesheets['tmp'].get_image(( 1*16,  0*16, 16, 16)), 90),
-            '[': pygame.transform.rotate(self.spritesheets['tmp'].get_image(( 1*16,  0*16, 16, 16)), -90),
-            '.': self.spritesheets['tmp'].get_image(( 0*16,  5*16, 16, 16)),
-            '*': self.spritesheets['tmp'].get_image(( 0*16, 15*16, 16, 16))
-        }
-
-        self.items = {
-            'Sword': self.spritesheets['tmp'].get_image((13*16,  3*16, 16, 16))
-        }
-        
-        self.hero_animations = {
-                                 'move':   [self.spritesheets['hero1'].get_image((64*(i%FC_HERO_MOVE), 64*(i//FC_HERO_MOVE), 64, 64)) for i in range(FC_HERO_MOVE*2)],
-                                 'attack': [self.spritesheets['hero2'].get_image((158*(i%FC_HERO_ATTACK), 0, 158, 112)) for i in range(FC_HERO_ATTACK)]
-                                }
-
-        self.entities = {'Pirate': {
-                                     'move': [self.spritesheets['pirate1'].get_image((50*i, 0, 50, 32)) for i in range(2)],
-                                     'attack': [self.spritesheets['pirate2'].get_image((50*i, 0, 50, 32)) for i in range(7)]
-                                    }
-                        }
-        self.bargainer = self.spritesheets['tmp'].get_image((9*16, 15*16, 16, 16))
-
-        self.inventory_bar = pygame.transform.rotate(self.spritesheets['inventory'].get_image((0, 0, INVENTORY_BAR_SIZE[1], INVENTORY_BAR_SIZE[0])), 90)
-        self.equipment_bar = self.spritesheets['inventory'].get_image((0, 0, 45, 180))
-        self.active_slot = self.spritesheets['slot'].get_image((0, 0, 45, 45))
-        self.fullHeart = self.spritesheets['health'].get_image((0, 0, 23, 21))
-        self.halfHeart = self.spritesheets['health'].get_image((23, 0, 23, 21))
-        self.emptyHeart = self.spritesheets['health'].get_image((46, 0, 23, 21))
-        self.armor = self.spritesheets['armor'].get_image((0, 0, 23, 21))
-        self.coin = self.spritesheets['coin'].get_image((0, 0, 16, 16))
-
-        self.pause_menu = self.spritesheets['pause'].get_image((0, 0, PAUSE_MENU_SIZE[0],  PAUSE_MENU_SIZE[1]))
-        self.shop_menu = self.spritesheets['shop'].get_image((0, 0, SHOP_MENU_SIZE[0], SHOP_MENU_SIZE[1]))
-        self.savename_input = self.spritesheets['savename'].get_image((0, 0, SAVENAME_INPUT[0],  SAVENAME_INPUT[1]))
-
-        self.portals = {
-                         'blue': [self.spritesheets['portals'].get_image((40*i, 0, 40, 75)) for i in range(9)],
-                         'red':  [pygame.transform.flip(self.spritesheets['portals'].get_image((40*i, 75, 40, 75)), True, False) for i in range(9)]
-                        }
+        self.transforms = TransformCache()
+        self.__directory = AtlasBuilder().build()
+        self.__atlases = {}
+
+        world = self.__group('world')
+        self.tiles = world['tiles']
+        self.items = world['items']
+        self.bargainer = world['bargainer']
+
+        interface = self.__group('interface')
+        self.inventory_bar = interface['inventory_bar']
+        self.equipment_bar = interface['equipment_bar']
+        self.active_slot = interface['active_slot']
+        self.fullHeart = interface['fullHeart']
+        self.halfHeart = interface['halfHeart']
+        self.emptyHeart = interface['emptyHeart']
+        self.armor = interface['armor']
+        self.coin = interface['coin']
+
+        self.hero_animations = LazyFrames({
+                                            'move':   lambda: self.__group('hero')['move'],
+                                            'attack': lambda: self.__group('hero_attack')['attack']
+                                           })
+        self.entities = LazyFrames({'Pirate': lambda: self.__group('pirates')})
+        self.portals = LazyFrames({
+                                    'blue': lambda: self.__group('portals')['blue'],
+                                    'red':  lambda: self.__group('portals')['red']
+                                   })
+
+    def __group(self, name):
+        frames = self.__atlases.get(name)
+        if frames is None:
+            frames = self.__atlases[name] = Atlas(self.__directory, name).frames
+        return frames
+
+    @property
+    def pause_menu(self):
+        return self.__group('menus')['pause_menu']
+
+    @property
+    def shop_menu(self):
+        return self.__group('menus')['shop_menu']
+
+    @property
+    def savename_input(self):
+        return self.__group('menus')['savename_input']
+
+    def transform(self, image, size=None, scale2x=False, flip_x=False, flip_y=False, angle=0):
+        return self.transforms.get(image, size, scale2x, flip_x, flip_y, angle)
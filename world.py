@@ -0,0 +1,124 @@
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import serializer
+from objects import Room
+from levelcompiler import read_room
+from constants import MAX_LOADED_ROOMS, COMPILED_LEVEL_EXTENSION
+
+
+class World:
+    # rooms are created from their level files the first time they are visited; past the budget the least
+    # recently visited ones are unloaded, and those that changed are written to a scratch directory of the world's
+    # own until they are needed again; in memory only the keys of the written rooms are kept
+    def __init__(self, levels, budget=MAX_LOADED_ROOMS):
+        self.__levels = levels
+        self.__budget = max(budget, 1)
+        self.__rooms = OrderedDict()
+        self.__saved = set()
+        self.__scratch = None
+        self.__baselines = {}
+
+    def room(self, level, index):
+        key = (level, index)
+        room = self.__rooms.get(key)
+        if room is not None:
+            self.__rooms.move_to_end(key)
+            return room
+
+        room = self.__load(level, index)
+        if room is not None:
+            self.__rooms[key] = room
+            self.__evict()
+        return room
+
+    def __load(self, level, index):
+        key = (level, index)
+        if key in self.__saved:
+            data = self.__read(key)
+            self.__discard(key)
+            # saved rooms whose terrain matches the level file leave it out
+            terrain = None if 'terrain' in data or 'tiles' in data else self.__terrain(level, index)
+            room = Room.load(data, terrain)
+            room.modified = True
+            return room
+
+        filename = self.__levels[level][index]
+        if filename is None:
+            return None
+        return Room.create(filename)
+
+    def __evict(self):
+        while len(self.__rooms) > self.__budget:
+            key, room = self.__rooms.popitem(last=False)
+            if room.modified:
+                self.__write(key, self.__delta(key, room))
+
+    def __path(self, key):
+        if self.__scratch is None:
+            # removed with the world, or when the game exits
+            self.__scratch = tempfile.TemporaryDirectory(prefix='rooms-')
+        return os.path.join(self.__scratch.name, hashlib.sha256(repr(key).encode()).hexdigest())
+
+    def __write(self, key, data):
+        with open(self.__path(key), 'wb') as file:
+            file.write(serializer.dumps(data))
+        self.__saved.add(key)
+
+    def __read(self, key):
+        with open(self.__path(key), 'rb') as file:
+            return serializer.loads(file.read())
+
+    def __discard(self, key):
+        os.remove(self.__path(key))
+        self.__saved.discard(key)
+
+    def __terrain(self, level, index):
+        filename = self.__levels[level][index]
+        return read_room(filename)[0] if filename.endswith(COMPILED_LEVEL_EXTENSION) else Room.create(filename).terrain
+
+    def __baseline(self, level, index):
+        # only a digest of each level file's grid is kept; the grids are mapped files, each holding a descriptor
+        digest = self.__baselines.get((level, index))
+        if digest is None:
+            digest = self.__baselines[(level, index)] = self.__digest(self.__terrain(level, index))
+        return digest
+
+    @staticmethod
+    def __digest(terrain):
+        return hashlib.sha256(np.ascontiguousarray(terrain).tobytes()).digest()
+
+    def __delta(self, key, room):
+        data = room.save()
+        if self.__digest(room.terrain) == self.__baseline(*key):
+            del data['terrain']
+        return data
+
+    def save(self):
+        # only rooms that changed since they were created from their level files, without unchanged terrain
+        levels = {}
+        for level, index in self.__saved:
+            levels.setdefault(level, {})[index] = self.__read((level, index))
+        for key, room in self.__rooms.items():
+            if room.modified:
+                levels.setdefault(key[0], {})[key[1]] = self.__delta(key, room)
+        return levels
+
+    def restore(self, levels):
+        self.__rooms.clear()
+        for key in list(self.__saved):
+            self.__discard(key)
+        for level in levels:
+            for index in levels[level]:
+                if levels[level][index] is not None:
+                    self.__write((level, index), levels[level][index])
+
+    @property
+    def loaded(self):
+        return len(self.__rooms)
+
+    @property
+    def rooms(self):
+        return list(self.__rooms.values())